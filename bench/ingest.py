@@ -0,0 +1,69 @@
+"""Measure score ingestion throughput: per-row commits vs. the batched ScoreWriter.
+
+Runs fully offline against a temporary SQLite database:
+
+    python bench/ingest.py --scores 20000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+
+from database import init_db  # noqa: E402
+from ingest import INGEST_MAX_BATCH, INGEST_MAX_DELAY, ScoreWriter  # noqa: E402
+
+
+def bench_per_row(db_name, scores):
+    """Insert scores the old way: one INSERT and commit per score under a global lock."""
+    conn = sqlite3.connect(db_name, check_same_thread=False, timeout=10)
+    lock = threading.Lock()
+    start = time.perf_counter()
+    for i in range(scores):
+        with lock:
+            conn.execute("INSERT INTO scores (user_id, score) VALUES (?, ?)", (1 + i % 100, i))
+            conn.commit()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+
+def bench_batched(db_name, scores, max_batch, max_delay):
+    """Queue scores on a ScoreWriter; returns (time to acknowledge all, time until all are durable)."""
+    writer = ScoreWriter(db_name, max_batch, max_delay)
+    start = time.perf_counter()
+    for i in range(scores):
+        writer.submit(1 + i % 100, i)
+    acked = time.perf_counter() - start
+    writer.close()
+    durable = time.perf_counter() - start
+    return acked, durable, writer.batches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scores", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=INGEST_MAX_BATCH)
+    parser.add_argument("--batch-delay", type=float, default=INGEST_MAX_DELAY)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before_db = os.path.join(tmp, "before.db")
+        after_db = os.path.join(tmp, "after.db")
+        init_db(before_db)
+        init_db(after_db)
+
+        per_row = bench_per_row(before_db, args.scores)
+        acked, durable, batches = bench_batched(after_db, args.scores, args.batch_size, args.batch_delay)
+
+    print(f"per-row commit : {args.scores / per_row:10.0f} submits/sec")
+    print(f"batched (ack)  : {args.scores / acked:10.0f} submits/sec")
+    print(f"batched (disk) : {args.scores / durable:10.0f} submits/sec in {batches} transactions")
+
+
+if __name__ == "__main__":
+    main()
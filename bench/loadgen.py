@@ -0,0 +1,209 @@
+"""Headless load generator for the TCP game server.
+
+Starts a server on a temporary SQLite database (unless --port points at a running
+one), then simulates N players with ServerAPI: each signs up, logs in and issues a
+seeded random mix of commands. Reports requests/sec and p50/p95/p99 latency per
+command and writes the results as JSON:
+
+    python bench/loadgen.py --players 50 --requests 200 --mode asyncio --output results.json
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "cleint"))
+
+from networking import ServerAPI  # noqa: E402
+
+SERVER_SCRIPT = os.path.join(ROOT, "server", "app.py")
+DEFAULT_MIX = "SUBMIT_SCORE=0.5,GLOBAL_LEADERBOARD=0.3,STATS=0.2"
+
+
+def parse_mix(text):
+    """Parse "COMMAND=weight,..." into (commands, weights)."""
+    pairs = [item.split("=") for item in text.split(",") if item]
+    return [name for name, _ in pairs], [float(weight) for _, weight in pairs]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(int(round(pct / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def free_port():
+    """Ask the OS for an unused TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(tmp_dir, port, mode, bcrypt_rounds):
+    """Launch server/app.py on a temporary database and wait until it accepts connections."""
+    log = open(os.path.join(tmp_dir, "server.log"), "w")
+    process = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT, "--port", str(port), "--mode", mode,
+         "--db", os.path.join(tmp_dir, "bench.db"), "--bcrypt-rounds", str(bcrypt_rounds),
+         # Every simulated player shares one address and hammers far above a human's request rate
+         "--conn-rate", "0", "--ip-rate", "0", "--user-rate", "0"],
+        stdout=log, stderr=subprocess.STDOUT, cwd=tmp_dir
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited early; see {log.name}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Server did not start within 30s")
+
+
+class Player:
+    """One simulated player with its own connection and random stream."""
+
+    def __init__(self, index, args, commands, weights, run_id):
+        self.index = index
+        self.args = args
+        self.commands = commands
+        self.weights = weights
+        self.rng = random.Random(args.seed * 100003 + index)
+        self.username = f"bench{run_id}_{index}"
+        self.latencies = {}  # command -> [seconds]
+        self.errors = {}  # command -> count
+
+    def timed(self, command, call):
+        """Run one request, recording its latency and whether it failed."""
+        start = time.perf_counter()
+        response = call()
+        self.latencies.setdefault(command, []).append(time.perf_counter() - start)
+        if (response[0] == "ERROR") if isinstance(response, list) else response.startswith("ERROR"):
+            self.errors[command] = self.errors.get(command, 0) + 1
+        return response
+
+    def run(self, start_barrier):
+        api = ServerAPI(self.args.host, self.args.port, self.args.encoding)
+        try:
+            try:
+                self.timed("SIGNUP", lambda: api.signup(self.username, "benchpw", f"{self.username}@bench.local"))
+                self.timed("LOGIN", lambda: api.login(self.username, "benchpw"))
+            except Exception:
+                start_barrier.abort()  # Don't leave the other players waiting forever
+                raise
+            start_barrier.wait()
+            for _ in range(self.args.requests):
+                command = self.rng.choices(self.commands, self.weights)[0]
+                if command == "SUBMIT_SCORE":
+                    score = self.rng.randint(0, 200)
+                    self.timed(command, lambda: api.submit_score(score))
+                elif command == "GLOBAL_LEADERBOARD":
+                    self.timed(command, api.get_global_leaderboard)
+                elif command == "LOCAL_LEADERBOARD":
+                    self.timed(command, api.get_local_leaderboard)
+                elif command == "STATS":
+                    self.timed(command, api.get_stats)
+                elif command == "RANK":
+                    self.timed(command, api.get_rank)
+                else:
+                    raise ValueError(f"Unknown command in mix: {command}")
+        finally:
+            api.close_connection()
+
+
+def summarize(players, elapsed):
+    """Merge per-player samples into per-command throughput and latency figures."""
+    merged, errors = {}, {}
+    for player in players:
+        for command, samples in player.latencies.items():
+            merged.setdefault(command, []).extend(samples)
+        for command, count in player.errors.items():
+            errors[command] = errors.get(command, 0) + count
+
+    results = {}
+    for command, samples in sorted(merged.items()):
+        samples.sort()
+        results[command] = {
+            "count": len(samples),
+            "errors": errors.get(command, 0),
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p95_ms": percentile(samples, 95) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+        }
+        if command not in ("SIGNUP", "LOGIN"):
+            results[command]["requests_per_sec"] = len(samples) / elapsed
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=100, help="requests per player after login")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted command mix, e.g. " + DEFAULT_MIX)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mode", choices=["thread", "asyncio"], default="asyncio",
+                        help="server mode when starting a local server")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4,
+                        help="bcrypt cost for the local server (low so signups don't dominate)")
+    parser.add_argument("--encoding", choices=["text", "binary"], default="text",
+                        help="wire encoding negotiated by each player's connection")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="benchmark an already running server instead")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    commands, weights = parse_mix(args.mix)
+    run_id = f"{args.seed}_{int(time.time())}" if args.port else str(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        server = None
+        if args.port is None:
+            args.port = free_port()
+            server = start_server(tmp_dir, args.port, args.mode, args.bcrypt_rounds)
+        try:
+            players = [Player(i, args, commands, weights, run_id) for i in range(args.players)]
+            start_barrier = threading.Barrier(args.players + 1)
+            threads = [threading.Thread(target=player.run, args=(start_barrier,)) for player in players]
+            for thread in threads:
+                thread.start()
+            start_barrier.wait()
+            start = time.perf_counter()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+
+    results = summarize(players, elapsed)
+    total = sum(r["count"] for c, r in results.items() if c not in ("SIGNUP", "LOGIN"))
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "elapsed_sec": elapsed,
+        "requests_per_sec": total / elapsed,
+        "commands": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'command':<20}{'count':>8}{'errors':>8}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for command, r in results.items():
+        print(f"{command:<20}{r['count']:>8}{r['errors']:>8}{r.get('requests_per_sec', 0):>10.0f}"
+              f"{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}")
+    print(f"total: {total / elapsed:.0f} req/s over {elapsed:.2f}s; results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
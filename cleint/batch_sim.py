@@ -0,0 +1,185 @@
+"""Headless batch simulator: steps thousands of Snake games in lockstep with NumPy.
+
+Follows the same rules as SnakeEngine, and for the same seeds and moves every
+game ends up with the same body, food, score and game over step. Reports
+games/sec when run directly:
+
+    python batch_sim.py --games 4096 --turn-chance 0.2 --seed 1
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from engine import DIRECTIONS, GRID_HEIGHT, GRID_WIDTH, MIN_SELF_COLLISION_LENGTH, OPPOSITE, START_BODY
+
+DIRECTION_NAMES = tuple(DIRECTIONS)  # Direction codes used by the batch: index into this tuple
+DIRECTION_CODES = {name: code for code, name in enumerate(DIRECTION_NAMES)}
+NO_TURN = -1  # Turn code meaning "keep going"
+NO_FOOD = -1  # Food cell once the board is full
+
+
+class BatchSimulator:
+    """count independent games held in NumPy arrays, one row per game.
+
+    Cells are indices y * width + x, as in SnakeEngine. Each body is a ring
+    buffer (head at head_slot, length segments long), occupancy counts the
+    segments on each cell, and free_cells/free_position/free_count mirror the
+    engine's swap-remove free list row by row. Food is drawn from each game's
+    own random.Random in the same order as the engine does. Eating is rare, so
+    that per-game Python call costs little next to the vectorized step.
+    """
+
+    def __init__(self, count, width=GRID_WIDTH, height=GRID_HEIGHT, seeds=None):
+        self.count = count
+        self.width = width
+        self.height = height
+        self.seeds = list(seeds) if seeds is not None else [None] * count
+        if len(self.seeds) != count:
+            raise ValueError(f"Expected {count} seeds, got {len(self.seeds)}")
+        self.dx = np.array([DIRECTIONS[name][0] for name in DIRECTION_NAMES], dtype=np.int8)
+        self.dy = np.array([DIRECTIONS[name][1] for name in DIRECTION_NAMES], dtype=np.int8)
+        self.opposite = np.array([DIRECTION_CODES[OPPOSITE[name]] for name in DIRECTION_NAMES], dtype=np.int8)
+        self.reset()
+
+    def reset(self):
+        """Start every game over: initial snake, direction, food and score."""
+        count, cells = self.count, self.width * self.height
+        rows = np.arange(count)
+        self.rngs = [random.Random(seed) for seed in self.seeds]
+        self.body = np.zeros((count, cells + 1), dtype=np.int32)
+        self.head_slot = np.zeros(count, dtype=np.int32)
+        self.length = np.zeros(count, dtype=np.int32)
+        self.occupancy = np.zeros((count, cells), dtype=np.uint8)
+        self.free_cells = np.tile(np.arange(cells, dtype=np.int32), (count, 1))
+        self.free_position = self.free_cells.copy()
+        self.free_count = np.full(count, cells, dtype=np.int32)
+        for slot, (x, y) in enumerate(START_BODY):
+            self.body[:, slot] = y * self.width + x
+            self.length += 1
+            self.occupy(rows, np.full(count, y * self.width + x, dtype=np.int32))
+        self.direction = np.full(count, DIRECTION_CODES["RIGHT"], dtype=np.int8)
+        self.score = np.zeros(count, dtype=np.int32)
+        self.steps = np.zeros(count, dtype=np.int32)  # Moves made before the game ended
+        self.game_over = np.zeros(count, dtype=bool)
+        self.food = np.full(count, NO_FOOD, dtype=np.int32)
+        self.place_food(rows)
+
+    def occupy(self, rows, cells):
+        """Add a segment to cells[i] of game rows[i], swap-removing newly covered cells from the free list."""
+        self.occupancy[rows, cells] += 1
+        covered = self.occupancy[rows, cells] == 1
+        rows, cells = rows[covered], cells[covered]
+        position = self.free_position[rows, cells]
+        self.free_count[rows] -= 1
+        last = self.free_cells[rows, self.free_count[rows]]
+        self.free_cells[rows, position] = last
+        self.free_position[rows, last] = position
+
+    def vacate(self, rows, cells):
+        """Remove a segment from cells[i] of game rows[i], appending emptied cells to the free list."""
+        self.occupancy[rows, cells] -= 1
+        emptied = self.occupancy[rows, cells] == 0
+        rows, cells = rows[emptied], cells[emptied]
+        self.free_position[rows, cells] = self.free_count[rows]
+        self.free_cells[rows, self.free_count[rows]] = cells
+        self.free_count[rows] += 1
+
+    def place_food(self, rows):
+        """Pick a uniformly random free cell as the food of each game in rows."""
+        for row in rows.tolist():
+            free = int(self.free_count[row])
+            self.food[row] = self.free_cells[row, self.rngs[row].randrange(free)] if free else NO_FOOD
+
+    def step(self, turns=None):
+        """Advance every running game one tick.
+
+        turns is an optional array of direction codes per game (NO_TURN keeps the
+        current direction); direct reversals are ignored as in SnakeEngine.turn().
+        Returns a boolean array of the games that ate this tick.
+        """
+        running = ~self.game_over
+        if turns is not None:
+            turns = np.asarray(turns)
+            turning = running & (turns != NO_TURN)
+            turning[turning] = turns[turning] != self.opposite[self.direction[turning]]
+            self.direction[turning] = turns[turning]
+
+        rows = np.flatnonzero(running)
+        direction = self.direction[rows]
+        head_y, head_x = np.divmod(self.body[rows, self.head_slot[rows]], self.width)
+        head_x = head_x + self.dx[direction]
+        head_y = head_y + self.dy[direction]
+        inside = (head_x >= 0) & (head_x < self.width) & (head_y >= 0) & (head_y < self.height)
+        self.game_over[rows[~inside]] = True  # Hitting a wall ends the game without moving
+
+        rows = rows[inside]
+        heads = head_y[inside] * self.width + head_x[inside]
+        capacity = self.body.shape[1]
+        self.head_slot[rows] = (self.head_slot[rows] - 1) % capacity
+        self.body[rows, self.head_slot[rows]] = heads
+        self.length[rows] += 1
+        self.steps[rows] += 1
+        self.occupy(rows, heads)
+
+        ate = np.zeros(self.count, dtype=bool)
+        eating = heads == self.food[rows]
+        ate[rows[eating]] = True
+        self.score[rows[eating]] += 1
+        self.place_food(rows[eating])
+
+        moving = rows[~eating]
+        self.length[moving] -= 1
+        tails = self.body[moving, (self.head_slot[moving] + self.length[moving]) % capacity]
+        self.vacate(moving, tails)
+
+        collided = (self.length[rows] >= MIN_SELF_COLLISION_LENGTH) & (self.occupancy[rows, heads] > 1)
+        self.game_over[rows[collided]] = True
+        return ate
+
+    def snake(self, game):
+        """Body of one game as a list of (x, y) cells, head first, like list(SnakeEngine.body)."""
+        slots = (self.head_slot[game] + np.arange(self.length[game])) % self.body.shape[1]
+        return [(int(cell % self.width), int(cell // self.width)) for cell in self.body[game, slots]]
+
+    def food_position(self, game):
+        """Food of one game as an (x, y) cell, or None if the board is full."""
+        cell = int(self.food[game])
+        return None if cell == NO_FOOD else (cell % self.width, cell // self.width)
+
+
+def random_turns(rng, count, turn_chance):
+    """Random policy: each game turns to a random direction with probability turn_chance."""
+    turns = rng.integers(0, len(DIRECTION_NAMES), count, dtype=np.int8)
+    turns[rng.random(count) >= turn_chance] = NO_TURN
+    return turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=4096)
+    parser.add_argument("--max-steps", type=int, default=10000, help="stop games still running after this many ticks")
+    parser.add_argument("--turn-chance", type=float, default=0.2, help="chance per tick of a random turn")
+    parser.add_argument("--seed", type=int, default=1, help="game i uses seed + i; the policy uses seed")
+    parser.add_argument("--width", type=int, default=GRID_WIDTH)
+    parser.add_argument("--height", type=int, default=GRID_HEIGHT)
+    args = parser.parse_args()
+
+    sim = BatchSimulator(args.games, args.width, args.height, seeds=range(args.seed, args.seed + args.games))
+    policy = np.random.default_rng(args.seed)
+    start = time.perf_counter()
+    ticks = 0
+    while ticks < args.max_steps and not sim.game_over.all():
+        sim.step(random_turns(policy, args.games, args.turn_chance))
+        ticks += 1
+    elapsed = time.perf_counter() - start
+
+    moves = int(sim.steps.sum())
+    print(f"{args.games} games, {ticks} ticks, {moves} moves in {elapsed:.2f}s")
+    print(f"games/s: {args.games / elapsed:.0f}  moves/s: {moves / elapsed:.0f}  "
+          f"mean score: {sim.score.mean():.2f}  max score: {sim.score.max()}")
+
+
+if __name__ == "__main__":
+    main()
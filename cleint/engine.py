@@ -0,0 +1,126 @@
+import random
+from collections import deque
+
+GRID_WIDTH = 40  # Cells across (800 px / 20 px)
+GRID_HEIGHT = 30  # Cells down (600 px / 20 px)
+START_BODY = ((5, 2), (4, 2), (3, 2))  # Head first, moving right
+MIN_SELF_COLLISION_LENGTH = 5  # Shorter snakes may fold onto themselves without dying
+
+DIRECTIONS = {
+    "UP": (0, -1),
+    "DOWN": (0, 1),
+    "LEFT": (-1, 0),
+    "RIGHT": (1, 0),
+}
+OPPOSITE = {"UP": "DOWN", "DOWN": "UP", "LEFT": "RIGHT", "RIGHT": "LEFT"}
+
+
+class SnakeEngine:
+    """Snake game state on a grid of cells, independent of pygame.
+
+    The body is a deque of (x, y) cells, head first, so moving and growing are
+    O(1). occupancy counts the segments on each cell rather than storing a bit:
+    a snake of four or fewer segments can reverse into itself and briefly
+    stack two segments on one cell, which the rules allow. Self-collision is
+    then a single lookup at the new head.
+
+    free_cells lists every cell index (y * width + x) the snake doesn't cover,
+    and free_position maps a cell index back to its slot in that list, so cells
+    are added and swap-removed in O(1) and food is a uniform pick among free
+    cells at any fill level.
+
+    Each game's food follows its seed, so seed plus the direction of every tick
+    (moves, run-length encoded) replays the game exactly; the server checks
+    submitted scores that way (server/replay.py mirrors these rules).
+    """
+
+    def __init__(self, width=GRID_WIDTH, height=GRID_HEIGHT, seed=None):
+        self.width = width
+        self.height = height
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        """Start a new game: initial snake, direction, food and score; a fresh seed unless one is given."""
+        self.seed = random.getrandbits(63) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.moves = []  # [direction, ticks] runs of the direction of every step, for the replay
+        self.body = deque(START_BODY)
+        self.occupancy = bytearray(self.width * self.height)
+        self.free_cells = list(range(self.width * self.height))
+        self.free_position = list(range(self.width * self.height))
+        for x, y in self.body:
+            self.occupy(y * self.width + x)
+        self.direction = "RIGHT"
+        self.score = 0
+        self.game_over = False
+        self.vacated = None  # Tail cell the last step moved off, for incremental redraws
+        self.food = self.random_food_position()
+
+    def turn(self, direction):
+        """Change direction, ignoring a direct reversal of the current one."""
+        if direction != OPPOSITE[self.direction]:
+            self.direction = direction
+
+    def is_occupied(self, cell):
+        x, y = cell
+        return self.occupancy[y * self.width + x] > 0
+
+    def occupy(self, index):
+        """Add a segment to a cell, dropping the cell from free_cells if it was empty."""
+        self.occupancy[index] += 1
+        if self.occupancy[index] == 1:
+            position = self.free_position[index]
+            last = self.free_cells.pop()
+            if last != index:
+                self.free_cells[position] = last
+                self.free_position[last] = position
+
+    def vacate(self, index):
+        """Remove a segment from a cell, returning the cell to free_cells once empty."""
+        self.occupancy[index] -= 1
+        if self.occupancy[index] == 0:
+            self.free_position[index] = len(self.free_cells)
+            self.free_cells.append(index)
+
+    def step(self):
+        """Advance one tick; returns True if the snake ate the food."""
+        self.vacated = None
+        if self.moves and self.moves[-1][0] == self.direction:
+            self.moves[-1][1] += 1
+        else:
+            self.moves.append([self.direction, 1])
+        dx, dy = DIRECTIONS[self.direction]
+        head_x, head_y = self.body[0]
+        head_x += dx
+        head_y += dy
+
+        if not (0 <= head_x < self.width and 0 <= head_y < self.height):
+            self.game_over = True
+            return False
+
+        head = (head_x, head_y)
+        self.body.appendleft(head)
+        self.occupy(head_y * self.width + head_x)
+
+        ate = head == self.food
+        if ate:
+            self.score += 1
+            self.food = self.random_food_position()
+        else:
+            self.vacated = tail_x, tail_y = self.body.pop()
+            self.vacate(tail_y * self.width + tail_x)
+
+        if len(self.body) >= MIN_SELF_COLLISION_LENGTH and self.occupancy[head_y * self.width + head_x] > 1:
+            self.game_over = True
+        return ate
+
+    def replay(self):
+        """The game's moves as a compact string of direction runs, e.g. "R12U3L40"."""
+        return "".join(f"{direction[0]}{ticks}" for direction, ticks in self.moves)
+
+    def random_food_position(self):
+        """Return a uniformly random cell not covered by the snake, or None if the board is full."""
+        if not self.free_cells:
+            return None
+        y, x = divmod(self.free_cells[self.rng.randrange(len(self.free_cells))], self.width)
+        return (x, y)
@@ -1,65 +1,574 @@
+import itertools
+import json
+import os
+import queue
+import re
+import select
 import socket
+import struct
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 SERVER_IP = "127.0.0.1"
 SERVER_PORT = 5050
+REQUEST_TIMEOUT = 5.0  # Seconds the background worker waits on the server before reconnecting
+RECONNECT_DELAYS = (1, 2, 5, 10, 30)  # Back-off between failed connection attempts, in seconds
+SCORE_QUEUE_FILE = "pending_scores.jsonl"
+MAX_SCORE_BATCH = 100  # Must not exceed the server's MAX_SCORE_BATCH
+INVALID_ENTRY = re.compile(r"Invalid entry ([0-9]+): ")  # SUBMIT_SCORES error naming the entry refused
+
+# Must match server/protocol.py: payload length (4 bytes) | request id (4 bytes) | payload
+FRAME_HEADER = struct.Struct("!II")
+PUSH_REQUEST_ID = 0  # Frames the server sends on its own (e.g. leaderboard updates)
+
+# Binary encoding, also mirrored from server/protocol.py (WORDS is append-only there)
+WORDS = (
+    "SUCCESS", "ERROR", "HELLO", "SIGNUP", "LOGIN", "SUBMIT_SCORE",
+    "GLOBAL_LEADERBOARD", "DAILY_LEADERBOARD", "WEEKLY_LEADERBOARD", "LEADERBOARD_PAGE", "RANK",
+    "LOCAL_LEADERBOARD", "STATS", "METRICS", "SUBSCRIBE_LEADERBOARD", "UNSUBSCRIBE_LEADERBOARD",
+    "SUBSCRIBED", "LEADERBOARD_DIFF", "SUBMIT_SCORES", "SUBMIT_REPLAY",
+)
+WORD_INDEX = {word: index for index, word in enumerate(WORDS)}
+INT8 = struct.Struct("!b")
+INT16 = struct.Struct("!h")
+INT32 = struct.Struct("!i")
+INT64 = struct.Struct("!q")
+LEN16 = struct.Struct("!H")
+LEN32 = struct.Struct("!I")
+# Fixed layouts of the most frequent messages, flagged by a first byte of 0x80 or above
+SUBMIT_SCORE_LAYOUT = 0x80
+SUBMIT_SCORE_HEADER = struct.Struct("!BiH")  # layout | score | token length, then the token
+RANKED_LAYOUT = 0x81
+RANKED_HEADER = struct.Struct("!BBBH")  # layout | word index | int count | entry count
+
+
+def encode_binary(fields):
+    """Encode a sequence of str/int/tuple fields with the server's tagged binary encoding."""
+    if len(fields) == 3 and fields[0] == "SUBMIT_SCORE":
+        try:
+            token = fields[1].encode()
+            return SUBMIT_SCORE_HEADER.pack(SUBMIT_SCORE_LAYOUT, fields[2], len(token)) + token
+        except (AttributeError, struct.error):
+            pass  # Doesn't fit the layout; send it tagged
+    out = bytearray()
+    for field in fields:
+        if isinstance(field, tuple):
+            out += b"e" + bytes((len(field),)) + encode_binary(field)
+        elif isinstance(field, int):
+            if -0x80 <= field <= 0x7F:
+                out += b"b" + INT8.pack(field)
+            elif -0x8000 <= field <= 0x7FFF:
+                out += b"h" + INT16.pack(field)
+            elif -0x80000000 <= field <= 0x7FFFFFFF:
+                out += b"i" + INT32.pack(field)
+            else:
+                out += b"q" + INT64.pack(field)
+        elif field in WORD_INDEX:
+            out += b"w" + bytes((WORD_INDEX[field],))
+        else:
+            data = str(field).encode()
+            if len(data) <= 0xFF:
+                out += b"a" + bytes((len(data),)) + data
+            elif len(data) <= 0xFFFF:
+                out += b"s" + LEN16.pack(len(data)) + data
+            else:
+                out += b"S" + LEN32.pack(len(data)) + data
+    return bytes(out)
+
+
+def decode_binary(payload, position=0, count=None):
+    """Decode a binary payload into a list of fields; entries become tuples."""
+    if count is None and payload[:1] == bytes((RANKED_LAYOUT,)):
+        return decode_ranked(payload)
+    fields = []
+    while position < len(payload) and (count is None or len(fields) < count):
+        tag = payload[position:position + 1]
+        position += 1
+        if tag == b"a":
+            end = position + 1 + payload[position]
+            fields.append(payload[position + 1:end].decode())
+            position = end
+        elif tag == b"h":
+            fields.append(INT16.unpack_from(payload, position)[0])
+            position += 2
+        elif tag == b"b":
+            fields.append(INT8.unpack_from(payload, position)[0])
+            position += 1
+        elif tag == b"i":
+            fields.append(INT32.unpack_from(payload, position)[0])
+            position += 4
+        elif tag == b"s":
+            end = position + 2 + LEN16.unpack_from(payload, position)[0]
+            fields.append(payload[position + 2:end].decode())
+            position = end
+        elif tag == b"w":
+            fields.append(WORDS[payload[position]])
+            position += 1
+        elif tag == b"e":
+            items, position = decode_binary(payload, position + 1, payload[position])
+            fields.append(tuple(items))
+        elif tag == b"q":
+            fields.append(INT64.unpack_from(payload, position)[0])
+            position += 8
+        elif tag == b"S":
+            end = position + 4 + LEN32.unpack_from(payload, position)[0]
+            fields.append(payload[position + 4:end].decode())
+            position = end
+        else:
+            raise ValueError(f"Unknown field tag {tag!r}")
+    return fields if count is None else (fields, position)
+
+
+def decode_ranked(payload):
+    """Decode the ranked layout: a word, int fields, then (username, score) entries."""
+    _, word, int_count, entry_count = RANKED_HEADER.unpack_from(payload)
+    numbers = struct.unpack_from(f"!{int_count + entry_count}i", payload, RANKED_HEADER.size)
+    position = RANKED_HEADER.size + 4 * len(numbers)
+    ends = list(itertools.accumulate(payload[position:position + entry_count]))
+    names = payload[position + entry_count:]
+    usernames = [names[start:end].decode() for start, end in zip([0] + ends, ends)]
+    return [WORDS[word], *numbers[:int_count], *zip(usernames, numbers[int_count:])]
+
 
 class ServerAPI:
-    def __init__(self):
+    """Framed connection to the game server.
+
+    With encoding="text" (the default) responses are "|"-delimited strings. With
+    encoding="binary" the connection is switched to the compact binary encoding
+    and responses are lists of fields, e.g. ["GLOBAL_LEADERBOARD", ("alice", 42)];
+    usernames can then contain any character. Servers without binary support
+    leave the connection in text mode, which self.encoding reflects.
+    """
+
+    def __init__(self, host=SERVER_IP, port=SERVER_PORT, encoding="text", timeout=None):
         self.token = None
-        self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.client_socket.connect((SERVER_IP, SERVER_PORT))
+        self.client_socket = socket.create_connection((host, port), timeout)
+
+        self.request_ids = itertools.count(1)
+        self.pending_responses = {}  # Responses read while waiting for a different request id
+        self.pushes = []  # Server-initiated messages not yet collected
+
+        self.encoding = "text"
+        if encoding != "text" and self.send_request("HELLO", encoding) == f"HELLO|{encoding}":
+            self.encoding = encoding
+
+    def recv_exact(self, size):
+        """Read exactly size bytes from the server."""
+        buf = bytearray()
+        while len(buf) < size:
+            chunk = self.client_socket.recv(size - len(buf))
+            if not chunk:
+                raise ConnectionError("Server closed the connection")
+            buf += chunk
+        return bytes(buf)
+
+    def encode_frame(self, fields):
+        """Frame a request under a fresh request id and return (request_id, frame bytes)."""
+        request_id = next(self.request_ids)
+        if self.encoding == "binary":
+            payload = encode_binary(fields)
+        else:
+            payload = "|".join(
+                ":".join(map(str, field)) if isinstance(field, tuple) else str(field) for field in fields
+            ).encode()
+        return request_id, FRAME_HEADER.pack(len(payload), request_id) + payload
+
+    def read_frame(self):
+        """Read one frame, setting aside pushes and responses for other requests."""
+        length, response_id = FRAME_HEADER.unpack(self.recv_exact(FRAME_HEADER.size))
+        payload = self.recv_exact(length)
+        message = decode_binary(payload) if self.encoding == "binary" else payload.decode()
+        if response_id == PUSH_REQUEST_ID:
+            self.pushes.append(message)
+        else:
+            self.pending_responses[response_id] = message
+
+    def wait_for(self, request_id):
+        """Read frames until the response for request_id arrives, keeping any others."""
+        while request_id not in self.pending_responses:
+            self.read_frame()
+        return self.pending_responses.pop(request_id)
+
+    def send_request(self, *fields):
+        """Send a request made of fields (command first) to server and get response."""
+        request_id, frame = self.encode_frame(fields)
+        self.client_socket.sendall(frame)
+        return self.wait_for(request_id)
 
-    def send_request(self, request):
-        """Send request to server and get response."""
-        self.client_socket.send(request.encode())
-        return self.client_socket.recv(1024).decode()
+    def pipeline(self, requests):
+        """Send several requests (tuples of fields) in one round trip and return their responses in order."""
+        frames = [self.encode_frame(fields) for fields in requests]
+        self.client_socket.sendall(b"".join(frame for _, frame in frames))
+        return [self.wait_for(request_id) for request_id, _ in frames]
+
+    def local_error(self, message):
+        """An error response produced without contacting the server, in this connection's encoding."""
+        return ["ERROR", message] if self.encoding == "binary" else f"ERROR|{message}"
 
     def signup(self, username, password, email):
         """Sign up a new user with an email."""
-        response = self.send_request(f"SIGNUP|{username}|{password}|{email}")
+        response = self.send_request("SIGNUP", username, password, email)
         return response
 
     def login(self, username, password):
         """Login the user and store the JWT token."""
-        response = self.send_request(f"LOGIN|{username}|{password}")
-        if response.startswith("SUCCESS"):
-            _, self.token = response.split("|")
+        response = self.send_request("LOGIN", username, password)
+        if self.encoding == "binary":
+            if response[0] == "SUCCESS":
+                self.token = response[1]
+        elif response.startswith("SUCCESS"):
+            _, self.token = response.split("|", 1)
         return response
 
     def submit_score(self, score):
         """Submit a player's score to the server."""
         if not self.token:
-            return "ERROR|User not authenticated"
-        return self.send_request(f"SUBMIT_SCORE|{self.token}|{score}")
+            return self.local_error("User not authenticated")
+        return self.send_request("SUBMIT_SCORE", self.token, score)
+
+    def submit_replay(self, score, seed, moves):
+        """Submit a score with its replay (SnakeEngine.seed and .replay()); it counts once the server verifies it."""
+        if not self.token:
+            return self.local_error("User not authenticated")
+        return self.send_request("SUBMIT_REPLAY", self.token, score, seed, moves)
+
+    def submit_scores(self, scores):
+        """Submit several (score, played_at[, entry_id][, seed, moves]) entries in one request.
+
+        The server accepts all of them or none, and counts an entry_id it has
+        already written only once.
+        """
+        if not self.token:
+            return self.local_error("User not authenticated")
+        return self.send_request("SUBMIT_SCORES", self.token, *[tuple(entry) for entry in scores])
 
     def get_global_leaderboard(self):
         """Fetch the global leaderboard (top 10 highest scores)."""
         return self.send_request("GLOBAL_LEADERBOARD")
 
+    def get_daily_leaderboard(self):
+        """Fetch today's leaderboard (top 10 best scores since 00:00 UTC)."""
+        return self.send_request("DAILY_LEADERBOARD")
+
+    def get_weekly_leaderboard(self):
+        """Fetch this week's leaderboard (top 10 best scores since Monday 00:00 UTC)."""
+        return self.send_request("WEEKLY_LEADERBOARD")
+
+    def get_leaderboard_page(self, offset, limit=10):
+        """Fetch `limit` global leaderboard entries starting at 0-based `offset`."""
+        return self.send_request("LEADERBOARD_PAGE", offset, limit)
+
+    def get_rank(self):
+        """Fetch the logged-in player's global rank and the players ranked around them."""
+        if not self.token:
+            return self.local_error("User not authenticated")
+        return self.send_request("RANK", self.token)
+
+    def subscribe_leaderboard(self):
+        """Ask the server to push top-10 changes; returns the initial SUBSCRIBED|user:score|... snapshot."""
+        return self.send_request("SUBSCRIBE_LEADERBOARD")
+
+    def unsubscribe_leaderboard(self):
+        """Stop leaderboard pushes."""
+        return self.send_request("UNSUBSCRIBE_LEADERBOARD")
+
+    def get_leaderboard_updates(self, timeout=0):
+        """Return pushed LEADERBOARD_DIFF|rank:username:score|... messages received so far.
+
+        Waits up to `timeout` seconds for the first one if none are buffered yet.
+        """
+        while select.select([self.client_socket], [], [], 0 if self.pushes else timeout)[0]:
+            self.read_frame()
+            timeout = 0
+        updates, self.pushes = self.pushes, []
+        return updates
+
     def get_local_leaderboard(self):
         """Fetch the local leaderboard (top 10 scores of the logged-in player)."""
         if not self.token:
-            return "ERROR|User not authenticated"
-        return self.send_request(f"LOCAL_LEADERBOARD|{self.token}")
+            return self.local_error("User not authenticated")
+        return self.send_request("LOCAL_LEADERBOARD", self.token)
 
     def get_stats(self):
         """Retrieve detailed game performance stats for the logged-in player."""
         if not self.token:
-            return "ERROR|User not authenticated"
-        return self.send_request(f"STATS|{self.token}")
+            return self.local_error("User not authenticated")
+        return self.send_request("STATS", self.token)
 
     def update_profile(self, new_username, new_email):
         """Update the player's username and email."""
         if not self.token:
-            return "ERROR|User not authenticated"
-        return self.send_request(f"UPDATE_PROFILE|{self.token}|{new_username}|{new_email}")
+            return self.local_error("User not authenticated")
+        return self.send_request("UPDATE_PROFILE", self.token, new_username, new_email)
 
     def get_profile(self):
         """Retrieve the player's profile details."""
         if not self.token:
-            return "ERROR|User not authenticated"
-        return self.send_request(f"GET_PROFILE|{self.token}")
+            return self.local_error("User not authenticated")
+        return self.send_request("GET_PROFILE", self.token)
 
     def close_connection(self):
         """Close the TCP connection."""
         self.client_socket.close()
+
+
+def is_error(response, message=None):
+    """Whether a text or binary response is an ERROR (optionally with the given message)."""
+    if isinstance(response, str):
+        return response.startswith("ERROR") and (message is None or response == f"ERROR|{message}")
+    return response[0] == "ERROR" and (message is None or response[1:] == [message])
+
+
+def invalid_entry(response):
+    """Index of the batch entry a SUBMIT_SCORES error says was refused, or None for other responses."""
+    if not is_error(response):
+        return None
+    message = response.split("|", 1)[-1] if isinstance(response, str) else str(response[-1])
+    match = INVALID_ENTRY.match(message)
+    return int(match.group(1)) if match else None
+
+
+class ScoreQueue:
+    """Scores the server has not accepted yet, kept in a file so they survive crashes and restarts.
+
+    Each line is a JSON [username, score, played_at, entry_id], followed by
+    seed and moves when the score has a replay; entry_id lets the server count a
+    resent score once. New scores are appended
+    and fsynced before add() returns; once a batch is accepted the file is
+    rewritten without it (temp file + os.replace, so it is never half written).
+    A torn last line from a crash mid-append is skipped when loading. Entries
+    the server refuses are moved to <path>.rejected with the reason.
+    """
+
+    def __init__(self, path=SCORE_QUEUE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = []
+        upgraded = False
+        try:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(entry, list) and len(entry) in (3, 5):
+                        entry.insert(3, uuid.uuid4().hex)  # Queued before entries had ids
+                        upgraded = True
+                    if isinstance(entry, list) and len(entry) in (4, 6):
+                        self.entries.append(entry)
+        except FileNotFoundError:
+            pass
+        if upgraded:
+            with self.lock:
+                self.save()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, username, score, played_at, replay=()):
+        """Queue a score; replay is an optional (seed, moves) pair."""
+        entry = [username, score, played_at, uuid.uuid4().hex, *replay]
+        with self.lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries.append(entry)
+
+    def pending(self, username, limit=MAX_SCORE_BATCH):
+        """Return up to limit of username's oldest queued entries."""
+        with self.lock:
+            return [entry for entry in self.entries if entry[0] == username][:limit]
+
+    def remove(self, sent):
+        """Drop entries returned by pending() once the server has accepted them."""
+        sent = {id(entry) for entry in sent}
+        with self.lock:
+            self.entries = [entry for entry in self.entries if id(entry) not in sent]
+            self.save()
+
+    def reject(self, entry, reason):
+        """Set aside an entry returned by pending() that the server will never accept."""
+        with self.lock:
+            with open(self.path + ".rejected", "a") as f:
+                f.write(json.dumps([*entry, reason]) + "\n")
+            self.entries = [queued for queued in self.entries if queued is not entry]
+            self.save()
+
+    def save(self):
+        """Rewrite the file from self.entries; the caller holds self.lock."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in self.entries)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class BackgroundServerAPI:
+    """ServerAPI for a render loop: every request runs on one background worker thread.
+
+    call() returns a concurrent.futures.Future right away. A callback passed to
+    it is not run on the worker but queued for poll(), which the game calls once
+    per frame, so callbacks can safely draw. Requests run in submission order.
+
+    The connection is opened lazily and re-opened after any network error, with
+    back-off while the server is unreachable; meanwhile requests complete at once
+    with "ERROR|Server unavailable". The worker logs in again with the remembered
+    credentials after reconnecting or when the token expires.
+
+    Scores go to a ScoreQueue before anything is sent and are flushed in batches
+    with SUBMIT_SCORES, so a score played while the server is down is sent later,
+    even after a restart of the game. A batch whose reply is lost is resent, and
+    the server counts each entry's id once. An entry the server refuses outright
+    is set aside so it can't hold back the scores queued after it.
+    """
+
+    def __init__(self, host=SERVER_IP, port=SERVER_PORT, encoding="text", queue_path=SCORE_QUEUE_FILE):
+        self.host = host
+        self.port = port
+        self.encoding = encoding
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="server-api")
+        self.callbacks = queue.SimpleQueue()
+        self.scores = ScoreQueue(queue_path)
+        self.api = None  # Only touched by the worker thread
+        self.failures = 0
+        self.retry_at = 0.0  # No connection attempts before this time.monotonic()
+        self.flush_at = 0.0  # No automatic flushes before this time.monotonic()
+        self.credentials = None
+        self.username = None
+        self.flushing = None  # Future of the queued flush, if any
+
+    def call(self, method, *args, callback=None):
+        """Run ServerAPI.method(*args) on the worker; callback(response) runs in a later poll()."""
+        future = self.executor.submit(self.run_call, method, args)
+        if callback is not None:
+            future.add_done_callback(lambda done: self.callbacks.put((callback, done)))
+        return future
+
+    def poll(self):
+        """Run the callbacks of finished requests and retry sending queued scores; call once per frame."""
+        while True:
+            try:
+                callback, future = self.callbacks.get_nowait()
+            except queue.Empty:
+                break
+            callback(future.result())
+        now = time.monotonic()
+        if self.username is not None and now >= max(self.retry_at, self.flush_at) and self.scores.pending(self.username, 1):
+            self.flush_scores()
+
+    def error(self, message):
+        return ["ERROR", message] if self.encoding == "binary" else f"ERROR|{message}"
+
+    def connection(self):
+        """Return a connected (and, with credentials, logged in) ServerAPI, or None while backing off."""
+        if self.api is not None:
+            return self.api
+        if time.monotonic() < self.retry_at:
+            return None
+        api = None
+        try:
+            api = ServerAPI(self.host, self.port, self.encoding, timeout=REQUEST_TIMEOUT)
+            if self.credentials is not None:
+                api.login(*self.credentials)
+        except OSError:
+            if api is not None:
+                api.close_connection()
+            self.failures += 1
+            self.retry_at = time.monotonic() + RECONNECT_DELAYS[min(self.failures, len(RECONNECT_DELAYS)) - 1]
+            return None
+        self.api = api
+        self.failures = 0
+        return api
+
+    def disconnect(self):
+        if self.api is not None:
+            self.api.close_connection()
+            self.api = None
+
+    def run_call(self, method, args):
+        """Worker side of call(): never raises, network failures become error responses."""
+        api = self.connection()
+        if api is None:
+            return self.error("Server unavailable")
+        try:
+            response = getattr(api, method)(*args)
+            if is_error(response, "Token expired") and self.credentials is not None:
+                api.login(*self.credentials)
+                response = getattr(api, method)(*args)
+            return response
+        except OSError:
+            self.disconnect()
+            return self.error("Server unavailable")
+
+    def login(self, username, password, callback=None):
+        """Log in and remember the credentials for reconnects; works offline too.
+
+        If the server can't be reached the credentials are kept anyway, so the
+        game can be played and its scores queued until it is back.
+        """
+        def remember(response):
+            if not is_error(response) or is_error(response, "Server unavailable"):
+                self.credentials = (username, password)
+                self.username = username
+            return response
+
+        future = self.executor.submit(lambda: remember(self.run_call("login", (username, password))))
+        if callback is not None:
+            future.add_done_callback(lambda done: self.callbacks.put((callback, done)))
+        return future
+
+    def submit_score(self, score, replay=()):
+        """Queue a score (and its (seed, moves) replay) durably and send it in the background.
+
+        Never blocks on the network.
+        """
+        if self.username is None:
+            return
+        self.scores.add(self.username, score, int(time.time()), replay)
+        self.flush_scores()
+
+    def flush_scores(self):
+        """Schedule sending the logged-in player's queued scores, unless a flush is already queued."""
+        if self.flushing is None or self.flushing.done():
+            self.flushing = self.executor.submit(self.send_queued_scores)
+        return self.flushing
+
+    def send_queued_scores(self):
+        """Worker side of flush_scores(): send batches until the queue is empty or a batch fails.
+
+        A batch refused because of one entry loses that entry to the rejected
+        file and is resent at once; any other error (e.g. Busy) is retried later.
+        """
+        while True:
+            batch = self.scores.pending(self.username)
+            if not batch:
+                return
+            response = self.run_call("submit_scores", ([entry[1:] for entry in batch],))
+            index = invalid_entry(response)
+            if index is not None and index < len(batch):
+                print(f"Queued score set aside: {response}")
+                self.scores.reject(batch[index], response if isinstance(response, str) else "|".join(response))
+                continue
+            if is_error(response):
+                if not is_error(response, "Server unavailable"):
+                    print(f"Queued scores not sent: {response}")
+                    self.flush_at = time.monotonic() + RECONNECT_DELAYS[-1]
+                return
+            self.scores.remove(batch)
+
+    def close(self, timeout=REQUEST_TIMEOUT):
+        """Give queued work up to timeout seconds to finish, then close the connection.
+
+        Scores that could not be sent stay in the queue file for the next run.
+        """
+        done = self.executor.submit(self.disconnect)
+        try:
+            done.result(timeout)
+        except Exception:
+            pass
+        self.executor.shutdown(wait=False, cancel_futures=True)
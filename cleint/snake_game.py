@@ -1,7 +1,7 @@
 import pygame
 import sys
-import random
-from networking import ServerAPI
+from engine import SnakeEngine
+from networking import BackgroundServerAPI
 
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
@@ -12,6 +12,11 @@ FOOD_COLOR = (255, 0, 0)
 TEXT_COLOR = (255, 255, 255)    
 BGCOLOR = (0, 0, 0)             
 BOUNDARY_COLOR = (255, 255, 0)  
+BOUNDARY_WIDTH = 4
+SCORE_POSITION = (10, 10)
+GAME_OVER_FPS = 15  # The game-over screen only polls for keys, so it needn't run at full speed
+
+LEADERBOARD_PAGE_SIZE = 10
 
 class SnakeGame:
     def get_stats(self):
@@ -20,62 +25,99 @@ class SnakeGame:
         return self.send_request(f"STATS|{self.token}")
 
     def draw_elements(self):
-        """Draw the background, boundary, snake, food, and score."""
+        """Draw the frame, repainting only the cells and text that changed since the last one."""
+        if self.full_redraw:
+            self.draw_full()
+            return
+
+        engine = self.engine
+        dirty = [self.draw_cell(engine.body[0], SNAKE_COLOR)]
+        if engine.vacated is not None:
+            # A short snake may still cover the cell it moved off
+            dirty.append(self.draw_cell(engine.vacated, self.cell_color(engine.vacated)))
+        if engine.food != self.drawn_food:
+            if engine.food is not None:
+                dirty.append(self.draw_cell(engine.food, FOOD_COLOR))
+            self.drawn_food = engine.food
+
+        # The score is drawn over the cells, so redraw it whenever it or a cell under it changed
+        if engine.score != self.drawn_score or self.score_rect.collidelist(dirty) != -1:
+            dirty.append(self.draw_score())
+
+        pygame.display.update(dirty)
+
+    def draw_full(self):
+        """Draw the background, boundary, snake, food, and score, and flip the whole window."""
         self.screen.fill(BGCOLOR)
 
         # Draw boundary
-        pygame.draw.rect(self.screen, BOUNDARY_COLOR, (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT), 4)
+        pygame.draw.rect(self.screen, BOUNDARY_COLOR, (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT), BOUNDARY_WIDTH)
 
         # Draw the snake
-        for x, y in self.snake_positions:
-            pygame.draw.rect(self.screen, SNAKE_COLOR, (x, y, CELL_SIZE, CELL_SIZE))
+        for x, y in self.engine.body:
+            pygame.draw.rect(self.screen, SNAKE_COLOR, (x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE))
 
-        # Draw the food
-        fx, fy = self.food_position
-        pygame.draw.rect(self.screen, FOOD_COLOR, (fx, fy, CELL_SIZE, CELL_SIZE))
+        # Draw the food (None once the snake covers the whole board)
+        self.drawn_food = self.engine.food
+        if self.engine.food is not None:
+            fx, fy = self.engine.food
+            pygame.draw.rect(self.screen, FOOD_COLOR, (fx * CELL_SIZE, fy * CELL_SIZE, CELL_SIZE, CELL_SIZE))
 
         # Display the score
-        score_text = self.font.render(f"Score: {self.score}", True, TEXT_COLOR)
-        self.screen.blit(score_text, (10, 10))
-
-    def check_collisions(self):
-        """Detect collisions with walls or itself."""
-        head_x, head_y = self.snake_positions[0]
-
-        # Check collision with walls
-        if head_x < 0 or head_x >= SCREEN_WIDTH or head_y < 0 or head_y >= SCREEN_HEIGHT:
-            self.game_over = True
-
-        # Check collision with itself
-        if len(self.snake_positions) > 4 and (self.snake_positions[0] in self.snake_positions[1:]):
-            self.game_over = True
+        self.drawn_score = None
+        self.score_rect = None
+        self.draw_score()
+
+        pygame.display.update()
+        self.full_redraw = False
+
+    def draw_cell(self, cell, color):
+        """Paint one grid cell (restoring any boundary it overlaps) and return its rect."""
+        x, y = cell
+        rect = pygame.Rect(x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE)
+        pygame.draw.rect(self.screen, color, rect)
+        if color == BGCOLOR and not self.inner_area.contains(rect):
+            self.screen.set_clip(rect)
+            pygame.draw.rect(self.screen, BOUNDARY_COLOR, (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT), BOUNDARY_WIDTH)
+            self.screen.set_clip(None)
+        return rect
+
+    def cell_color(self, cell):
+        """Color a cell should currently be drawn in."""
+        if self.engine.is_occupied(cell):
+            return SNAKE_COLOR
+        if cell == self.engine.food:
+            return FOOD_COLOR
+        return BGCOLOR
+
+    def draw_score(self):
+        """Draw the score over the cells beneath it and return the area touched.
+
+        The text surface is only re-rendered when the score changed. The cells
+        under it are repainted first so the antialiased text is never blended
+        onto an earlier copy of itself.
+        """
+        area = self.score_rect
+        if self.engine.score != self.drawn_score:
+            self.score_surface = self.font.render(f"Score: {self.engine.score}", True, TEXT_COLOR)
+            self.drawn_score = self.engine.score
+            self.score_rect = self.score_surface.get_rect(topleft=SCORE_POSITION)
+            area = self.score_rect if area is None else area.union(self.score_rect)
+        for cell in self.cells_in(area):
+            self.draw_cell(cell, self.cell_color(cell))
+        self.screen.blit(self.score_surface, SCORE_POSITION)
+        return area
+
+    def cells_in(self, rect):
+        """Grid cells overlapping a pixel rect."""
+        for y in range(rect.top // CELL_SIZE, (rect.bottom - 1) // CELL_SIZE + 1):
+            for x in range(rect.left // CELL_SIZE, (rect.right - 1) // CELL_SIZE + 1):
+                yield x, y
 
     def update_snake(self):
-        """Move the snake in the current direction and check for food collision."""
-        head_x, head_y = self.snake_positions[0]
-
-        if self.snake_direction == "UP":
-            head_y -= CELL_SIZE
-        elif self.snake_direction == "DOWN":
-            head_y += CELL_SIZE
-        elif self.snake_direction == "LEFT":
-            head_x -= CELL_SIZE
-        elif self.snake_direction == "RIGHT":
-            head_x += CELL_SIZE
-
-        new_head = (head_x, head_y)
-        self.snake_positions.insert(0, new_head)
-
-        snake_rect = pygame.Rect(head_x, head_y, CELL_SIZE, CELL_SIZE)
-        food_x, food_y = self.food_position
-        food_rect = pygame.Rect(food_x, food_y, CELL_SIZE, CELL_SIZE)
-
-        if snake_rect.colliderect(food_rect):
-            self.score += 1
-            self.food_position = self.random_food_position()  
-            print(f"Food eaten! Score is now {self.score}")
-        else:
-            self.snake_positions.pop()
+        """Advance the game state one tick (movement, food and collisions)."""
+        if self.engine.step():
+            print(f"Food eaten! Score is now {self.engine.score}")
 
     def __init__(self):
         pygame.init()
@@ -85,45 +127,41 @@ class SnakeGame:
         self.clock = pygame.time.Clock()
         self.font = pygame.font.SysFont(None, 28)
 
-        self.server_api = ServerAPI()
+        self.server_api = BackgroundServerAPI()  # Never blocks the frame loop on the network
         self.username = None
+        self.leaderboard_offset = 0
+
+        # Game state lives in the engine, in grid cells; this class only draws it
+        self.engine = SnakeEngine(SCREEN_WIDTH // CELL_SIZE, SCREEN_HEIGHT // CELL_SIZE)
 
-        self.reset_game()
+        # Incremental rendering state: what is currently on screen
+        self.inner_area = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT).inflate(-2 * BOUNDARY_WIDTH, -2 * BOUNDARY_WIDTH)
+        self.full_redraw = True
+        self.drawn_food = None
+        self.drawn_score = None
+        self.score_surface = None
+        self.score_rect = None
+        self.game_over_surface = None
 
     def reset_game(self):
         """Reset snake positions, direction, food, and score."""
-        self.snake_positions = [
-            (100, 50),  
-            (80, 50),
-            (60, 50),   
-        ]
-        self.snake_direction = "RIGHT"
-        self.food_position = self.random_food_position()
-        self.score = 0
-        self.game_over = False
-
-    def random_food_position(self):
-        """Return a random (x, y) position, aligned to the grid."""
-        max_x = (SCREEN_WIDTH - CELL_SIZE) // CELL_SIZE
-        max_y = (SCREEN_HEIGHT - CELL_SIZE) // CELL_SIZE
-        x = random.randint(0, max_x) * CELL_SIZE
-        y = random.randint(0, max_y) * CELL_SIZE
-        return (x, y)
+        self.engine.reset()
+        self.full_redraw = True
+        self.score_rect = None
 
     def run(self):
         """Main game loop: handle events, update, draw."""
         self.handle_user_auth() 
         while True:
             self.handle_events()
+            self.server_api.poll()
 
-            if not self.game_over:
+            if not self.engine.game_over:
                 self.update_snake()
-                self.check_collisions()
                 self.draw_elements()
             else:
                 self.show_game_over()
 
-            pygame.display.update()
             self.clock.tick(10)  
 
     def handle_user_auth(self):
@@ -138,7 +176,7 @@ class SnakeGame:
 
         if choice == "1":
             email = input("Email: ")  
-            response = self.server_api.signup(username, password, email)  
+            response = self.server_api.call("signup", username, password, email).result()
             print(response)
             if "SUCCESS" in response:
                 print("Sign up successful! Now logging in...")
@@ -146,73 +184,119 @@ class SnakeGame:
                 print("Sign up failed:", response)
                 sys.exit(0)
 
-        response = self.server_api.login(username, password)
+        response = self.server_api.login(username, password).result()
         if "SUCCESS" in response:
             self.username = username
             print(f"Logged in as {username}")
+        elif response == "ERROR|Server unavailable":
+            self.username = username
+            print("Server unreachable; playing offline. Scores will be sent once it is back.")
         else:
             print("Login failed:", response)
             sys.exit(0)
 
     def show_game_over(self):
         """Handle GAME OVER screen."""
-        self.server_api.submit_score(self.score)
+        # Queued and sent in the background, with the replay the server verifies the score against
+        self.server_api.submit_score(self.engine.score, (self.engine.seed, self.engine.replay()))
         
-        while True:
-            self.screen.fill(BGCOLOR)
-            game_over_text = self.font.render(
-                "GAME OVER! [R]estart | [Q]uit | [G]lobal LB | [L]ocal LB | [S]tats",
+        if self.game_over_surface is None:
+            self.game_over_surface = self.font.render(
+                "GAME OVER! [R]estart | [Q]uit | [G]lobal/[D]aily/[W]eekly LB | [N]ext page | [L]ocal LB | [S]tats",
                 True,
                 TEXT_COLOR
             )
-            self.screen.blit(game_over_text, (SCREEN_WIDTH // 8, SCREEN_HEIGHT // 2))
-            pygame.display.update()
-
+        # The screen is static, so draw it once (and when the window is exposed) and then only poll for keys
+        exposed = True
+        while True:
+            if exposed:
+                self.screen.fill(BGCOLOR)
+                self.screen.blit(self.game_over_surface, (SCREEN_WIDTH // 8, SCREEN_HEIGHT // 2))
+                pygame.display.update()
+                exposed = False
+            self.clock.tick(GAME_OVER_FPS)
+            self.server_api.poll()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
+                    self.quit()
+                elif event.type == pygame.VIDEOEXPOSE:
+                    exposed = True
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_r:
                         self.reset_game()
                         return  
                     elif event.key == pygame.K_q:
-                        pygame.quit()
-                        sys.exit()
+                        self.quit()
                     elif event.key == pygame.K_g:
+                        self.leaderboard_offset = 0
+                        self.show_global_leaderboard()
+                    elif event.key == pygame.K_n:
+                        self.leaderboard_offset += LEADERBOARD_PAGE_SIZE
                         self.show_global_leaderboard()
+                    elif event.key == pygame.K_d:
+                        self.server_api.call("get_daily_leaderboard",
+                                             callback=lambda data: self.show_window_leaderboard("DAILY", data))
+                    elif event.key == pygame.K_w:
+                        self.server_api.call("get_weekly_leaderboard",
+                                             callback=lambda data: self.show_window_leaderboard("WEEKLY", data))
                     elif event.key == pygame.K_l:
-                        self.show_local_leaderboard()
+                        self.server_api.call("get_local_leaderboard", callback=self.show_local_leaderboard)
                     elif event.key == pygame.K_s:
-                        self.show_stats_screen()
+                        self.server_api.call("get_stats", callback=self.show_stats_screen)
 
     def show_global_leaderboard(self):
-        """Fetch and display global leaderboard (Top 10 scores across all users)."""
-        leaderboard_data = self.server_api.get_global_leaderboard()
+        """Fetch one page of the global leaderboard and the player's own rank; both print when they arrive."""
+        self.server_api.call("get_leaderboard_page", self.leaderboard_offset, LEADERBOARD_PAGE_SIZE,
+                             callback=self.show_leaderboard_page)
+        self.server_api.call("get_rank", callback=self.show_rank)
 
+    def show_leaderboard_page(self, leaderboard_data):
+        """Display one page of the global leaderboard."""
         print("\n=== GLOBAL LEADERBOARD ===")
 
-        if "LEADERBOARD" in leaderboard_data:
-            leaderboard_entries = leaderboard_data.split("|")[1:]
+        if leaderboard_data.startswith("LEADERBOARD_PAGE"):
+            _, offset, total, *leaderboard_entries = leaderboard_data.split("|")
 
-            if not leaderboard_entries or leaderboard_entries == ['']:
-                print("No scores available yet.")
-                return
+            if not leaderboard_entries:
+                print("No scores available yet." if int(total) == 0 else "No more entries.")
+                self.leaderboard_offset = 0
+            else:
+                self.print_ranked_entries(int(offset) + 1, leaderboard_entries)
+                print(f"({total} players ranked)")
 
-            for i, entry in enumerate(leaderboard_entries):
-                try:
-                    username, score = entry.split(":")
-                    print(f"{i+1}. {username} - {score}")
-                except ValueError:
-                    print(f"Skipping malformed entry: {entry}")
+        else:
+            print("Error retrieving leaderboard.")
 
+    def show_rank(self, rank_data):
+        """Display the player's global rank and the players ranked around them."""
+        if rank_data.startswith("RANK"):
+            _, rank, total, first_rank, *rank_entries = rank_data.split("|")
+            print(f"\nYour rank: #{rank} of {total}")
+            self.print_ranked_entries(int(first_rank), rank_entries)
+
+    def show_window_leaderboard(self, title, leaderboard_data):
+        """Display a daily or weekly top 10 (same username:score format as the global board)."""
+        print(f"\n=== {title} LEADERBOARD ===")
+        if leaderboard_data.startswith(f"{title}_LEADERBOARD"):
+            leaderboard_entries = leaderboard_data.split("|")[1:]
+            if not leaderboard_entries:
+                print("No scores available yet.")
+            self.print_ranked_entries(1, leaderboard_entries)
         else:
             print("Error retrieving leaderboard.")
 
+    def print_ranked_entries(self, first_rank, entries):
+        """Print username:score entries numbered from first_rank."""
+        for i, entry in enumerate(entries):
+            try:
+                username, score = entry.split(":")
+                print(f"{first_rank + i}. {username} - {score}")
+            except ValueError:
+                print(f"Skipping malformed entry: {entry}")
 
-    def show_local_leaderboard(self):
-        """Fetch and display local leaderboard (Top 10 scores of logged-in user)."""
-        leaderboard_data = self.server_api.get_local_leaderboard()
+
+    def show_local_leaderboard(self, leaderboard_data):
+        """Display local leaderboard (Top 10 scores of logged-in user)."""
         print("\n=== YOUR BEST SCORES ===")
         if "LEADERBOARD" in leaderboard_data:
             leaderboard_entries = leaderboard_data.split("|")[1:]
@@ -221,10 +305,8 @@ class SnakeGame:
         else:
             print("Error retrieving leaderboard.")
 
-    def show_stats_screen(self):
-        """Fetch and display player statistics."""
-        stats_data = self.server_api.get_stats()
-
+    def show_stats_screen(self, stats_data):
+        """Display player statistics."""
         print("\n=== PLAYER STATS ===")
 
         if "STATS" in stats_data:
@@ -239,17 +321,24 @@ class SnakeGame:
         """Process user input/events (arrow keys, quit, etc.)."""
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
+                self.quit()
+            elif event.type == pygame.VIDEOEXPOSE:
+                self.full_redraw = True  # Window contents may have been lost
             elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_UP and self.snake_direction != "DOWN":
-                    self.snake_direction = "UP"
-                elif event.key == pygame.K_DOWN and self.snake_direction != "UP":
-                    self.snake_direction = "DOWN"
-                elif event.key == pygame.K_LEFT and self.snake_direction != "RIGHT":
-                    self.snake_direction = "LEFT"
-                elif event.key == pygame.K_RIGHT and self.snake_direction != "LEFT":
-                    self.snake_direction = "RIGHT"
+                if event.key == pygame.K_UP:
+                    self.engine.turn("UP")
+                elif event.key == pygame.K_DOWN:
+                    self.engine.turn("DOWN")
+                elif event.key == pygame.K_LEFT:
+                    self.engine.turn("LEFT")
+                elif event.key == pygame.K_RIGHT:
+                    self.engine.turn("RIGHT")
+
+    def quit(self):
+        """Close the window and exit, giving queued requests and scores a moment to reach the server."""
+        pygame.quit()
+        self.server_api.close()
+        sys.exit()
 
 def main():
     game = SnakeGame()
@@ -1,136 +1,615 @@
+import argparse
+import asyncio
+import signal
 import socket
+import sys
 import threading
 import sqlite3
-import bcrypt
 import datetime
 import jwt
 import time
+from concurrent.futures import ThreadPoolExecutor
+from database import DB_NAME, READ_POOL_SIZE, ReadPool, init_db
+from auth import BCRYPT_ROUNDS, HASH_QUEUE_LIMIT, HASH_WORKERS, PasswordHasher, TokenCache
+from ingest import INGEST_MAX_BATCH, INGEST_MAX_DELAY, ScoreWriter
+from leaderboard import WINDOW_BUCKETS, LeaderboardIndex, WindowedLeaderboard
+from metrics import REGISTRY, serve_http
+from protocol import (
+    CODECS, FrameError, decode_text, encode_frame, encode_reply, encode_text, is_framed, read_frame, read_frame_async
+)
+from ratelimit import CONNECTION_RATE, IDLE_TIMEOUT, IP_RATE, MAX_CONNECTIONS, USER_RATE, RateLimiter
+from replay import REPLAY_QUEUE_LIMIT, REPLAY_WORKERS, ReplayVerifier, parse_moves, parse_seed
+from snapshot import SNAPSHOT_INTERVAL, SnapshotWriter, read_snapshot, snapshot_path
+from subscriptions import LeaderboardBroadcaster, SocketPusher, StreamPusher
 
-DB_NAME = "snake_game.db"
 SECRET_KEY = "supersecretkey"
 
-db_lock = threading.Lock()  # 🔒 Added global lock for thread safety
-
-def init_db():
-    """Initialize the database and create required tables if they do not exist."""
-    conn = sqlite3.connect(DB_NAME, check_same_thread=False, timeout=10)  # ✅ Set timeout to prevent locking
-    cursor = conn.cursor()
-
-    # Enable WAL mode for concurrent reads/writes
-    cursor.execute("PRAGMA journal_mode=WAL;")
-    cursor.execute("PRAGMA synchronous=NORMAL;")
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        email TEXT UNIQUE NOT NULL
-    )
-    """)
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS scores (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        score INTEGER NOT NULL,
-        FOREIGN KEY (user_id) REFERENCES users(id)
-    )
-    """)
-
-    conn.commit()
-    conn.close()
-    print("[✔] Database initialized successfully.")
+LISTEN_BACKLOG = 4096  # Kernel caps this at net.core.somaxconn
+DB_WORKERS = 8  # Executor threads for SQLite work in asyncio mode
+AUTH_COMMANDS = {"SIGNUP", "LOGIN"}
+# Commands whose first argument is a session token, charged to that user's rate limit too
+TOKEN_COMMANDS = {"SUBMIT_SCORE", "SUBMIT_SCORES", "SUBMIT_REPLAY", "RANK", "LOCAL_LEADERBOARD", "STATS"}
+MAX_PIPELINE = 32  # In-flight framed requests per connection in asyncio mode
+GLOBAL_LEADERBOARD_SIZE = 10
+MAX_PAGE_SIZE = 100
+RANK_NEIGHBOURS = 2  # Players shown either side of the caller in RANK responses
+INVALID_COMMAND = ("ERROR", "Invalid Command")
+SUBSCRIPTION_COMMANDS = {"SUBSCRIBE_LEADERBOARD", "UNSUBSCRIBE_LEADERBOARD"}
+RATE_LIMITED = ("ERROR", "Rate limited")
+SERVER_FULL = ("ERROR", "Server full")
+MALFORMED_REQUEST = ("ERROR", "Malformed request")
+REJECT_TIMEOUT = 2.0  # Seconds an over-capacity connection gets to send its first request
+REJECT_WORKERS = 4  # Threads answering over-capacity connections in thread mode
+MAX_PENDING_REJECTS = 256  # Over-capacity connections waiting for an answer; later ones are just closed
+MAX_SCORE_BATCH = 100  # Scores accepted in one SUBMIT_SCORES request
+MAX_BACKDATE = 7 * 24 * 3600  # Older batched scores are dated this far back (they still count all-time)
+MAX_SCORE = 2 ** 31  # Scores must fit a signed 32-bit integer
+MAX_CLIENT_ID = 64  # Characters in the id a client gives a batched score
+
+def parse_score(score):
+    """Decode a submitted score; raises ValueError if out of range."""
+    score = int(score)
+    if not 0 <= score < MAX_SCORE:
+        raise ValueError("Invalid score")
+    return score
+
+def parse_entry(entry):
+    """Decode a SUBMIT_SCORES entry into (score, played_at, client_id, replay); raises ValueError if malformed.
+
+    An entry is score:played_at, then optionally the client's id for the score,
+    then seed:moves if it has a replay; the item count tells them apart.
+    """
+    items = entry.split(":") if isinstance(entry, str) else list(entry)
+    client_id = None
+    if len(items) in (3, 5):
+        client_id = str(items.pop(2))
+        if not 0 < len(client_id) <= MAX_CLIENT_ID:
+            raise ValueError("Invalid entry id")
+    if len(items) == 2:
+        score, played_at = items
+        replay = ()
+    elif len(items) == 4:
+        score, played_at, seed, moves = items
+        replay = (parse_seed(seed), parse_moves(moves))
+    else:
+        raise ValueError("Malformed entry")
+    return parse_score(score), int(played_at), client_id, replay
+
+def raise_fd_limit():
+    """Raise the open-file soft limit to the hard limit so idle sockets don't exhaust it."""
+    try:
+        import resource
+    except ImportError:  # Not available on Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
 
 class GameServer:
-    def __init__(self, host="127.0.0.1", port=5050):
+    def __init__(self, host="127.0.0.1", port=5050, db_name=DB_NAME,
+                 max_batch=INGEST_MAX_BATCH, max_delay=INGEST_MAX_DELAY,
+                 hash_workers=HASH_WORKERS, hash_queue=HASH_QUEUE_LIMIT, bcrypt_rounds=BCRYPT_ROUNDS,
+                 read_pool_size=READ_POOL_SIZE, score_writer=None, reuse_port=False,
+                 connection_rate=CONNECTION_RATE, ip_rate=IP_RATE, user_rate=USER_RATE,
+                 max_connections=MAX_CONNECTIONS, idle_timeout=IDLE_TIMEOUT,
+                 replay_workers=REPLAY_WORKERS, replay_queue=REPLAY_QUEUE_LIMIT, require_replay=False,
+                 snapshot_interval=SNAPSHOT_INTERVAL, write_snapshots=True):
         self.host = host
         self.port = port
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-        # ✅ Use a single persistent connection for better performance
-        self.db_conn = sqlite3.connect(DB_NAME, check_same_thread=False, timeout=10)
-        self.db_cursor = self.db_conn.cursor()
+        self.reuse_port = reuse_port  # Let several worker processes bind the same port
+        self.server_socket = None
+
+        # One dedicated writer connection; scores are acknowledged once queued
+        # and group-committed in the background. Cluster workers pass a writer
+        # that forwards to the cluster's writer process instead.
+        self.score_writer = score_writer or ScoreWriter(db_name, max_batch, max_delay, self.apply_written)
+
+        # Read-only connections so queries run concurrently under WAL
+        self.read_pool = ReadPool(db_name, read_pool_size)
+
+        # Best score per player, served from memory instead of re-aggregating `scores`
+        self.leaderboard = LeaderboardIndex()
+        # Daily/weekly boards: only the current window's bucket, rolled over in memory
+        self.windows = {period: WindowedLeaderboard(period) for period in WINDOW_BUCKETS}
+        self.snapshot_path = snapshot_path(db_name)
+        with self.read_pool.connection() as conn:
+            self.load_leaderboard(conn.cursor())
+            for window in self.windows.values():
+                window.load(conn.cursor())
+        # Cluster workers leave snapshots to the writer process
+        self.snapshots = SnapshotWriter(db_name, self.snapshot_path, snapshot_interval) if write_snapshots else None
+
+        # Pushes top-N changes to subscribed connections instead of clients polling
+        self.broadcaster = LeaderboardBroadcaster(self.leaderboard)
+
+        # bcrypt runs in worker processes behind a bounded admission queue
+        self.hasher = PasswordHasher(hash_workers, hash_queue, bcrypt_rounds)
+
+        # Replays re-simulated in worker processes; their scores count once verified
+        self.replays = ReplayVerifier(self.accept_score, replay_workers, replay_queue)
+        self.require_replay = require_replay  # Refuse scores sent without a replay
+
+        # Tokens verified once per session instead of on every request
+        self.tokens = TokenCache(SECRET_KEY)
+
+        # Token buckets per connection, client address and user, charged by command cost
+        self.rate_limiter = RateLimiter(connection_rate, ip_rate, user_rate)
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout or None  # 0 disables
+
+        self.connections_lock = threading.Lock()
+        self.active_connections = 0
+        self.register_gauges()
+
+        # Bounded executors used by the asyncio mode for blocking work
+        self.db_executor = None
+        self.auth_executor = None
+        # Answers connections over the cap in thread mode, so they never get a thread of their own
+        self.reject_executor = None
+        self.reject_slots = threading.BoundedSemaphore(MAX_PENDING_REJECTS)
 
     def start(self):
-        """Start the server and listen for client connections."""
+        """Start the server and listen for client connections (one thread per client)."""
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.server_socket.bind((self.host, self.port))
-        self.server_socket.listen(5)
+        self.server_socket.listen(LISTEN_BACKLOG)
         print(f"Server running on {self.host}:{self.port}")
+        self.reject_executor = ThreadPoolExecutor(max_workers=REJECT_WORKERS, thread_name_prefix="reject")
 
         while True:
             client_socket, addr = self.server_socket.accept()
+            if self.track_connection(1) > self.max_connections:
+                self.track_connection(-1)
+                self.reject_later(client_socket)
+                continue
             print(f"New connection from {addr}")
-            threading.Thread(target=self.handle_client, args=(client_socket,)).start()
+            threading.Thread(target=self.handle_client, args=(client_socket,), daemon=True).start()
+
+    def reject_later(self, client_socket):
+        """Hand a connection over the cap to the reject threads, or close it if they are backed up."""
+        if not self.reject_slots.acquire(blocking=False):
+            REGISTRY.inc("snake_connections_rejected_total")
+            client_socket.close()
+            return
+        self.reject_executor.submit(self.reject_connection, client_socket)
+
+    def load_leaderboard(self, cursor):
+        """Warm the all-time leaderboard from the snapshot plus newer scores, or from user_stats without one."""
+        start = time.perf_counter()
+        snapshot = read_snapshot(self.snapshot_path)
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM scores")
+        if snapshot is None or snapshot[0] > cursor.fetchone()[0]:  # Missing, or not from this database
+            self.leaderboard.load(cursor)
+            print(f"Leaderboard loaded from the database: {len(self.leaderboard)} players "
+                  f"in {time.perf_counter() - start:.2f}s")
+            return
+
+        last_id, rows = snapshot
+        self.leaderboard.load_rows(rows)
+        cursor.execute("""
+            SELECT scores.user_id, users.username, scores.score
+            FROM scores
+            JOIN users ON scores.user_id = users.id
+            WHERE scores.id > ?
+        """, (last_id,))
+        newer = cursor.fetchall()
+        for user_id, username, score in newer:
+            self.leaderboard.update(user_id, score, username)
+        print(f"Leaderboard loaded from snapshot: {len(self.leaderboard)} players and {len(newer)} newer scores "
+              f"in {time.perf_counter() - start:.2f}s")
+
+    def register_gauges(self):
+        """Expose queue depths and cache counters, read only when metrics are scraped."""
+        REGISTRY.describe("snake_request_duration_seconds", "Time spent handling a command")
+        REGISTRY.describe("snake_request_errors_total", "Commands answered with ERROR")
+        REGISTRY.describe("snake_rate_limited_total", "Commands rejected by a connection or address rate limit")
+        REGISTRY.describe("snake_connections_rejected_total", "Connections turned away at the connection cap")
+        REGISTRY.describe("snake_auth_rejected_total", "Requests refused for a missing, invalid or expired token")
+        REGISTRY.gauge("snake_active_connections", lambda: self.active_connections)
+        REGISTRY.gauge("snake_score_queue_depth", self.score_writer.pending)
+        REGISTRY.gauge("snake_hash_in_flight", lambda: self.hasher.in_flight)
+        REGISTRY.describe("snake_replays_total", "Replays verified, rejected, or that failed to run")
+        REGISTRY.describe("snake_replay_verify_seconds", "Time spent re-simulating one replay")
+        REGISTRY.gauge("snake_replay_queue_depth", lambda: self.replays.pending)
+        REGISTRY.gauge("snake_db_pool_idle_connections", self.read_pool.connections.qsize)
+        REGISTRY.describe("snake_token_cache_hits_total", "Token checks answered from the cache")
+        REGISTRY.describe("snake_token_cache_misses_total", "Token checks that verified the JWT signature")
+        REGISTRY.counter("snake_token_cache_hits_total", lambda: self.tokens.stats()[0])
+        REGISTRY.counter("snake_token_cache_misses_total", lambda: self.tokens.stats()[1])
+        REGISTRY.gauge("snake_leaderboard_players", lambda: len(self.leaderboard))
+        REGISTRY.gauge("snake_leaderboard_subscribers", self.broadcaster.subscriber_count)
+
+    def track_connection(self, delta):
+        """Adjust the open connection count and return the new count."""
+        with self.connections_lock:
+            self.active_connections += delta
+            return self.active_connections
+
+    def close(self):
+        """Flush queued scores and release the database connection; returns how many scores were lost."""
+        self.replays.close()  # Verified scores still go to the writer below
+        self.broadcaster.close()
+        dropped = self.score_writer.close()
+        if self.snapshots is not None:
+            self.snapshots.close()  # Written after the last flush, so the next start is warm
+        self.hasher.close()
+        self.read_pool.close()
+        if self.reject_executor is not None:
+            self.reject_executor.shutdown(wait=False, cancel_futures=True)
+        return dropped or 0
+
+    def start_async(self):
+        """Start the server on a single asyncio event loop multiplexing all clients."""
+        raise_fd_limit()
+        self.db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+        # One thread per admitted hash request, so admitted requests never queue for a thread
+        self.auth_executor = ThreadPoolExecutor(max_workers=self.hasher.max_pending, thread_name_prefix="auth")
+        try:
+            asyncio.run(self.serve_async())
+        finally:
+            self.db_executor.shutdown(wait=True)
+            self.auth_executor.shutdown(wait=True)
+
+    async def serve_async(self):
+        """Accept connections on the running event loop until cancelled."""
+        server = await asyncio.start_server(
+            self.handle_client_async, self.host, self.port,
+            backlog=LISTEN_BACKLOG, reuse_address=True, reuse_port=self.reuse_port or None
+        )
+        print(f"Server running on {self.host}:{self.port} (asyncio)")
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        previous = signal.getsignal(signal.SIGTERM)
+        try:
+            # SIGTERM ends serving here instead of raising SystemExit inside whichever task is running
+            loop.add_signal_handler(signal.SIGTERM, stop.set)
+        except NotImplementedError:  # e.g. Windows event loops
+            stop = None
+        try:
+            async with server:
+                await (server.serve_forever() if stop is None else stop.wait())
+        finally:
+            if stop is not None:
+                loop.remove_signal_handler(signal.SIGTERM)
+                signal.signal(signal.SIGTERM, previous)
+
+    def dispatch(self, fields):
+        """Handle a single decoded request and record its latency per command."""
+        start = time.perf_counter()
+        command, *args = fields
+        try:
+            response = self.route(command, args)
+        except Exception as e:  # Every request id still gets an answer
+            print(f"Error handling {command}: {e!r}")
+            response = ("ERROR", "Internal server error")
+
+        if response is INVALID_COMMAND:
+            command = "INVALID"  # Keep label cardinality bounded
+        labels = (("command", command),)
+        REGISTRY.observe("snake_request_duration_seconds", time.perf_counter() - start, labels)
+        if response[0] == "ERROR":
+            REGISTRY.inc("snake_request_errors_total", labels)
+        return response
+
+    def route(self, command, args):
+        """Route a command to its handler and return the response fields."""
+        try:
+            if command == "SIGNUP":
+                return self.signup(*args)
+            elif command == "LOGIN":
+                return self.login(*args)
+            elif command == "SUBMIT_SCORE":
+                return self.submit_score(*args)
+            elif command == "SUBMIT_SCORES":
+                return self.submit_scores(*args)
+            elif command == "SUBMIT_REPLAY":
+                return self.submit_replay(*args)
+            elif command == "GLOBAL_LEADERBOARD":
+                return self.get_global_leaderboard()
+            elif command == "DAILY_LEADERBOARD":
+                return self.get_window_leaderboard("daily", command)
+            elif command == "WEEKLY_LEADERBOARD":
+                return self.get_window_leaderboard("weekly", command)
+            elif command == "LEADERBOARD_PAGE":
+                return self.get_leaderboard_page(*args)
+            elif command == "RANK":
+                return self.get_rank(*args)
+            elif command == "LOCAL_LEADERBOARD":
+                return self.get_local_leaderboard(*args)
+            elif command == "STATS":
+                return self.get_stats(*args)
+            elif command == "METRICS":
+                return ("METRICS", REGISTRY.render())
+            elif command in SUBSCRIPTION_COMMANDS or command == "HELLO":
+                return ("ERROR", "Command requires the framed protocol")
+        except TypeError:
+            return ("ERROR", "Invalid arguments")
+        return INVALID_COMMAND
+
+    def request_user(self, fields):
+        """User id of a request's session token if it is already verified and cached, else None."""
+        if fields[0] in TOKEN_COMMANDS and len(fields) > 1 and isinstance(fields[1], str):
+            return self.tokens.lookup(fields[1])
+        return None
+
+    def handle_request(self, fields, limit):
+        """Dispatch a request, rejecting it when over its rate limit or the hasher is saturated."""
+        command = fields[0]
+        if not limit.allow(command, self.request_user(fields)):
+            REGISTRY.inc("snake_rate_limited_total")
+            return RATE_LIMITED
+        if command not in AUTH_COMMANDS:
+            return self.dispatch(fields)
+        if not self.hasher.try_acquire():
+            REGISTRY.inc("snake_auth_rejected_total")
+            return ("ERROR", "Busy")
+        try:
+            return self.dispatch(fields)
+        finally:
+            self.hasher.release()
+
+    async def dispatch_async(self, fields, limit):
+        """Run a request on the executor matching its blocking work (bcrypt or SQLite)."""
+        command = fields[0]
+        if not limit.allow(command, self.request_user(fields)):
+            REGISTRY.inc("snake_rate_limited_total")
+            return RATE_LIMITED  # Answered on the loop without touching an executor
+        loop = asyncio.get_running_loop()
+        if command not in AUTH_COMMANDS:
+            return await loop.run_in_executor(self.db_executor, self.dispatch, fields)
+        if not self.hasher.try_acquire():
+            REGISTRY.inc("snake_auth_rejected_total")
+            return ("ERROR", "Busy")
+        try:
+            return await loop.run_in_executor(self.auth_executor, self.dispatch, fields)
+        finally:
+            self.hasher.release()
 
     def handle_client(self, client_socket):
-        """Handle incoming client requests."""
+        """Handle incoming client requests, framed or legacy unframed text (already counted as open)."""
+        try:
+            # Also bounds how long a client may stall mid-request
+            client_socket.settimeout(self.idle_timeout)
+            first = client_socket.recv(1, socket.MSG_PEEK)
+            if not first:
+                return
+            limit = self.rate_limiter.connection(client_socket.getpeername()[0])
+            if is_framed(first):
+                self.serve_framed(client_socket, limit)
+            else:
+                self.serve_legacy(client_socket, limit)
+        except socket.timeout:
+            pass  # Idle connection
+        except Exception as e:
+            print(f"Error handling client: {e}")
+        finally:
+            self.track_connection(-1)
+            client_socket.close()
+
+    def reject_connection(self, client_socket):
+        """Reject-thread task: answer a connection over the cap, then close it."""
+        try:
+            client_socket.settimeout(REJECT_TIMEOUT)
+            first = client_socket.recv(1, socket.MSG_PEEK)
+            if first:
+                self.reject_client(client_socket, is_framed(first))
+        except (FrameError, OSError):
+            pass  # Includes socket.timeout: the client never sent its first request
+        finally:
+            client_socket.close()
+            self.reject_slots.release()
+
+    def reject_client(self, client_socket, framed):
+        """Answer a connection over the cap with SERVER_FULL in the protocol it speaks."""
+        REGISTRY.inc("snake_connections_rejected_total")
+        if framed:
+            frame = read_frame(client_socket)
+            if frame is not None:
+                client_socket.sendall(encode_frame(frame[0], encode_text(SERVER_FULL)))
+        else:
+            client_socket.sendall(encode_text(SERVER_FULL))
+
+    def serve_framed(self, client_socket, limit):
+        """Answer length-prefixed frames in order, echoing each request id."""
+        send_lock = threading.Lock()  # Shared with leaderboard pushes
+        pusher = SocketPusher(client_socket, send_lock)
         try:
             while True:
-                request = client_socket.recv(1024).decode()
-                if not request:
+                frame = read_frame(client_socket)
+                if frame is None:
                     break
-
-                command, *args = request.split("|")
-
-                if command == "SIGNUP":
-                    response = self.signup(*args)
-                elif command == "LOGIN":
-                    response = self.login(*args)
-                elif command == "SUBMIT_SCORE":
-                    response = self.submit_score(*args)
-                elif command == "GLOBAL_LEADERBOARD":
-                    response = self.get_global_leaderboard()
-                elif command == "LOCAL_LEADERBOARD":
-                    response = self.get_local_leaderboard(*args)
-                elif command == "STATS":
-                    response = self.get_stats(*args)
-                else:
-                    response = "ERROR|Invalid Command"
-
-                client_socket.send(response.encode())
+                request_id, payload = frame
+                encode, decode = CODECS[pusher.encoding]
+                try:
+                    fields = decode(payload)
+                except FrameError:
+                    # The frame itself arrived intact, so only this request fails
+                    with send_lock:
+                        client_socket.sendall(encode_reply(request_id, encode, self.malformed_request(limit)))
+                    continue
+                if fields[0] in SUBSCRIPTION_COMMANDS or fields[0] == "HELLO":
+                    # Hold the lock so the reply reaches the client before any push
+                    with send_lock:
+                        response = self.handle_connection_command(fields, pusher, limit)
+                        client_socket.sendall(encode_reply(request_id, encode, response))
+                        # Subscribers may stay silent indefinitely while receiving pushes
+                        subscribed = self.broadcaster.is_subscribed(pusher)
+                        client_socket.settimeout(None if subscribed else self.idle_timeout)
+                    continue
+                response = self.handle_request(fields, limit)
+                with send_lock:
+                    client_socket.sendall(encode_reply(request_id, encode, response))
+        finally:
+            self.broadcaster.unsubscribe(pusher)
+
+    def handle_connection_command(self, fields, pusher, limit):
+        """Handle commands that change connection state: HELLO and (un)subscribing to pushes.
+
+        The reply to HELLO|<encoding> is sent in the old encoding; every later
+        frame in either direction uses the new one.
+        """
+        command = fields[0]
+        if not limit.allow(command):
+            REGISTRY.inc("snake_rate_limited_total")
+            return RATE_LIMITED
+        if command == "HELLO":
+            encoding = fields[1] if len(fields) > 1 else "text"
+            if encoding not in CODECS:
+                return ("ERROR", "Unsupported encoding")
+            pusher.encoding = encoding
+            return ("HELLO", encoding)
+        if command == "SUBSCRIBE_LEADERBOARD":
+            return ("SUBSCRIBED", *self.broadcaster.subscribe(pusher))
+        self.broadcaster.unsubscribe(pusher)
+        return ("SUCCESS", "Unsubscribed")
+
+    def malformed_request(self, limit):
+        """Answer a request whose payload can't be decoded; it still counts against the rate limit."""
+        if not limit.allow("INVALID"):
+            REGISTRY.inc("snake_rate_limited_total")
+            return RATE_LIMITED
+        REGISTRY.inc("snake_request_errors_total", (("command", "INVALID"),))
+        return MALFORMED_REQUEST
+
+    def serve_legacy(self, client_socket, limit):
+        """Answer old clients that send one unframed command per recv."""
+        while True:
+            request = client_socket.recv(1024)
+            if not request:
+                break
+
+            try:
+                fields = decode_text(request)
+            except FrameError:
+                response = self.malformed_request(limit)
+            else:
+                response = self.handle_request(fields, limit)
+            client_socket.send(encode_text(response))
+
+    async def handle_client_async(self, reader, writer):
+        """Handle incoming client requests on the event loop."""
+        addr = writer.get_extra_info("peername")
+        print(f"New connection from {addr}")
+        over_capacity = self.track_connection(1) > self.max_connections
+        try:
+            first = await asyncio.wait_for(reader.read(1), REJECT_TIMEOUT if over_capacity else self.idle_timeout)
+            if not first:
+                return
+            if over_capacity:
+                await self.reject_client_async(reader, writer, first)
+                return
+            limit = self.rate_limiter.connection(addr[0])
+            if is_framed(first):
+                await self.serve_framed_async(reader, writer, first, limit)
+            else:
+                await self.serve_legacy_async(reader, writer, first, limit)
+        except asyncio.TimeoutError:
+            pass  # Idle connection
+        except asyncio.CancelledError:
+            pass  # Server shutting down; asyncio's stream callback would log the cancellation as an error
         except Exception as e:
             print(f"Error handling client: {e}")
         finally:
-            client_socket.close()
+            self.track_connection(-1)
+            writer.close()
+
+    async def reject_client_async(self, reader, writer, prefix):
+        """Answer a connection over the cap with SERVER_FULL in the protocol it speaks."""
+        REGISTRY.inc("snake_connections_rejected_total")
+        if is_framed(prefix):
+            frame = await asyncio.wait_for(read_frame_async(reader, prefix), REJECT_TIMEOUT)
+            if frame is not None:
+                writer.write(encode_frame(frame[0], encode_text(SERVER_FULL)))
+        else:
+            writer.write(encode_text(SERVER_FULL))
+        await writer.drain()
+
+    async def serve_framed_async(self, reader, writer, prefix, limit):
+        """Run pipelined frames concurrently; responses may complete out of order."""
+        in_flight = asyncio.Semaphore(MAX_PIPELINE)
+        tasks = set()
+        pusher = StreamPusher(asyncio.get_running_loop(), writer)
+
+        async def respond(request_id, fields, encode):
+            try:
+                response = await self.dispatch_async(fields, limit)
+                writer.write(encode_reply(request_id, encode, response))
+                await writer.drain()
+            finally:
+                in_flight.release()
+
+        try:
+            while True:
+                # Subscribers may stay silent indefinitely while receiving pushes
+                timeout = None if self.broadcaster.is_subscribed(pusher) else self.idle_timeout
+                frame = await asyncio.wait_for(read_frame_async(reader, prefix), timeout)
+                prefix = b""
+                if frame is None:
+                    break
+                request_id, payload = frame
+                # Requests are answered in the encoding in effect when they arrived
+                encode, decode = CODECS[pusher.encoding]
+                try:
+                    fields = decode(payload)
+                except FrameError:
+                    # The frame itself arrived intact, so only this request fails
+                    writer.write(encode_reply(request_id, encode, self.malformed_request(limit)))
+                    continue
+                if fields[0] in SUBSCRIPTION_COMMANDS or fields[0] == "HELLO":
+                    # Answered inline so the reply is written before any push
+                    response = self.handle_connection_command(fields, pusher, limit)
+                    writer.write(encode_reply(request_id, encode, response))
+                    continue
+                await in_flight.acquire()
+                task = asyncio.create_task(respond(request_id, fields, encode))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self.broadcaster.unsubscribe(pusher)
+
+    async def serve_legacy_async(self, reader, writer, prefix, limit):
+        """Answer old clients that send one unframed command per read."""
+        data = prefix + await asyncio.wait_for(reader.read(1023), self.idle_timeout)
+        while data:
+            try:
+                fields = decode_text(data)
+            except FrameError:
+                response = self.malformed_request(limit)
+            else:
+                response = await self.dispatch_async(fields, limit)
+            writer.write(encode_text(response))
+            await writer.drain()
+            data = await asyncio.wait_for(reader.read(1024), self.idle_timeout)
 
     def execute_query(self, query, params=(), fetch_one=False, fetch_all=False):
-        """Execute SQL queries with a global lock to avoid database locking issues."""
-        max_retries = 5
-        delay = 0.5
+        """Execute a read query on a pooled read-only connection (no global lock)."""
+        return self.read_pool.execute(query, params, fetch_one, fetch_all)
 
-        for attempt in range(max_retries):
-            with db_lock:  # 🔒 Ensures only one thread writes at a time
-                try:
-                    self.db_cursor.execute(query, params)
-                    if fetch_one:
-                        result = self.db_cursor.fetchone()
-                    elif fetch_all:
-                        result = self.db_cursor.fetchall()
-                    else:
-                        result = None
-
-                    self.db_conn.commit()
-                    return result
-                except sqlite3.OperationalError as e:
-                    if "database is locked" in str(e):
-                        print(f"Database is locked. Retrying ({attempt+1}/{max_retries})...")
-                        time.sleep(delay)
-                    else:
-                        raise e
+    def execute_write(self, query, params=()):
+        """Execute a write statement on the dedicated writer connection."""
+        return self.score_writer.execute(query, params)
 
     def signup(self, username, password, email):
         """Register a new user."""
-        hashed_pw = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+        if "|" in username or ":" in username:
+            # Would break the username:score entries text clients parse
+            return ("ERROR", "Username may not contain '|' or ':'")
+        hashed_pw = self.hasher.hash(password)
 
         try:
-            self.execute_query(
+            self.execute_write(
                 "INSERT INTO users (username, password, email) VALUES (?, ?, ?)", 
                 (username, hashed_pw, email)
             )
-            return "SUCCESS|User registered"
+            return ("SUCCESS", "User registered")
         except sqlite3.IntegrityError:
-            return "ERROR|Username or email already exists"
+            return ("ERROR", "Username or email already exists")
 
     def login(self, username, password):
         """Authenticate user and return JWT token."""
@@ -139,89 +618,267 @@ class GameServer:
 
         if row:
             user_id, stored_hashed = row
-            if bcrypt.checkpw(password.encode(), stored_hashed):
+            if self.hasher.check(password, stored_hashed):
                 token = jwt.encode(
                     {"user_id": user_id, "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=1)},
                     SECRET_KEY,
                     algorithm="HS256"
                 )
-                return f"SUCCESS|{token}"
-        return "ERROR|Invalid credentials"
+                return ("SUCCESS", token)
+        return ("ERROR", "Invalid credentials")
 
     def submit_score(self, token, score):
         """Submit a player's score."""
         try:
-            decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            user_id = decoded["user_id"]
+            user_id = self.tokens.verify(token)
+            if self.require_replay:
+                return ("ERROR", "Replay required")
+
+            self.accept_score(user_id, parse_score(score), int(time.time()))
+            return ("SUCCESS", "Score submitted")
+        except jwt.ExpiredSignatureError:
+            return ("ERROR", "Token expired")
+        except Exception as e:
+            return ("ERROR", str(e))
+
+    def submit_scores(self, token, *entries):
+        """Submit a batch of entries (see parse_entry()), e.g. scores queued offline.
+
+        The batch is validated as a whole before any score is applied, so a
+        client can drop its queued copy exactly when it gets SUCCESS back. A bad
+        entry fails the batch with "Invalid entry <index>: <reason>", so the
+        client can set that one aside and resend the rest. Entries with a replay
+        only count once it has been verified, and an entry whose client id was
+        already written is not counted again.
+        """
+        try:
+            user_id = self.tokens.verify(token)
+            if len(entries) > MAX_SCORE_BATCH:
+                return ("ERROR", f"At most {MAX_SCORE_BATCH} scores per batch")
+
+            now = int(time.time())
+            scores = []
+            for index, entry in enumerate(entries):
+                try:
+                    score, played_at, client_id, replay = parse_entry(entry)
+                    if not replay and self.require_replay:
+                        raise ValueError("Replay required")
+                except (ValueError, TypeError) as e:
+                    return ("ERROR", f"Invalid entry {index}: {e}")
+                # A score dated in the future would roll the daily and weekly windows over early
+                scores.append((score, min(max(played_at, now - MAX_BACKDATE), now), client_id, replay))
+            if not self.replays.reserve(sum(1 for *_, replay in scores if replay)):
+                return ("ERROR", "Busy")
+            for score, played_at, client_id, replay in scores:
+                if replay:
+                    self.replays.submit(user_id, score, played_at, *replay, client_id)
+                else:
+                    self.accept_score(user_id, score, played_at, client_id)
+            return ("SUCCESS", len(scores))
+        except jwt.ExpiredSignatureError:
+            return ("ERROR", "Token expired")
+        except Exception as e:
+            return ("ERROR", str(e))
+
+    def submit_replay(self, token, score, seed, moves):
+        """Submit a score with the replay that produced it; it counts once the replay checks out."""
+        try:
+            user_id = self.tokens.verify(token)
 
-            self.execute_query("INSERT INTO scores (user_id, score) VALUES (?, ?)", 
-                               (user_id, int(score)))
-            return "SUCCESS|Score submitted"
+            score, seed, runs = parse_score(score), parse_seed(seed), parse_moves(moves)
+            if not self.replays.reserve(1):
+                return ("ERROR", "Busy")
+            self.replays.submit(user_id, score, int(time.time()), seed, runs)
+            return ("SUCCESS", "Replay submitted")
         except jwt.ExpiredSignatureError:
-            return "ERROR|Token expired"
+            return ("ERROR", "Token expired")
         except Exception as e:
-            return f"ERROR|{str(e)}"
+            return ("ERROR", str(e))
+
+    def accept_score(self, user_id, score, played_at, client_id=None):
+        """Queue a score for the database and apply it to the in-memory leaderboards.
+
+        A score with a client id may be a resend the writer skips, so it is
+        applied only once the writer reports it written (apply_written()).
+        """
+        self.score_writer.submit(user_id, score, played_at, client_id)
+        if client_id is None:
+            self.record_score(user_id, score, played_at)
+
+    def apply_written(self, rows):
+        """Score writer callback: apply scores written with a client id to the in-memory leaderboards."""
+        for user_id, score, played_at, _ in rows:
+            self.record_score(user_id, score, played_at)
+
+    def record_score(self, user_id, score, played_at):
+        """Apply an accepted score to the all-time and time-windowed leaderboards."""
+        username = self.leaderboard.username(user_id)
+        if username is None:
+            row = self.execute_query("SELECT username FROM users WHERE id = ?", (user_id,), fetch_one=True)
+            if row is None:
+                return
+            username = row[0]
+        if self.leaderboard.update(user_id, score, username):
+            self.broadcaster.notify()
+        for window in self.windows.values():
+            window.record(user_id, score, played_at, username)
 
     def get_global_leaderboard(self):
         """Retrieve the global leaderboard (Top 10 highest scores)."""
-        rows = self.execute_query("""
-            SELECT users.username, MAX(scores.score)
-            FROM scores
-            JOIN users ON scores.user_id = users.id
-            GROUP BY scores.user_id
-            ORDER BY MAX(scores.score) DESC
-            LIMIT 10
-        """, fetch_all=True)
+        rows = self.leaderboard.top(GLOBAL_LEADERBOARD_SIZE)
+        return ("GLOBAL_LEADERBOARD", *rows)
+
+    def get_window_leaderboard(self, period, command):
+        """Retrieve the top 10 best scores of the current day or week."""
+        rows = self.windows[period].top(GLOBAL_LEADERBOARD_SIZE)
+        return (command, *rows)
+
+    def get_leaderboard_page(self, offset, limit):
+        """Retrieve `limit` global leaderboard entries starting at 0-based `offset`."""
+        try:
+            offset = max(int(offset), 0)
+            limit = min(max(int(limit), 0), MAX_PAGE_SIZE)
+        except ValueError:
+            return ("ERROR", "Invalid page")
+
+        rows = self.leaderboard.page(offset, limit)
+        return ("LEADERBOARD_PAGE", offset, len(self.leaderboard), *rows)
+
+    def get_rank(self, token):
+        """Retrieve the player's global rank and the players ranked around them."""
+        try:
+            user_id = self.tokens.verify(token)
 
-        leaderboard = "GLOBAL_LEADERBOARD|" + "|".join([f"{row[0]}:{row[1]}" for row in rows])
-        return leaderboard
+            result = self.leaderboard.rank(user_id, RANK_NEIGHBOURS)
+            if result is None:
+                return ("ERROR", "No scores yet")
+
+            rank, first_rank, rows = result
+            return ("RANK", rank, len(self.leaderboard), first_rank, *rows)
+        except jwt.ExpiredSignatureError:
+            return ("ERROR", "Token expired")
+        except Exception as e:
+            return ("ERROR", str(e))
 
     def get_local_leaderboard(self, token):
         """Retrieve the player's top 10 personal scores."""
         try:
-            decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            user_id = decoded["user_id"]
+            user_id = self.tokens.verify(token)
 
             rows = self.execute_query(
                 "SELECT score FROM scores WHERE user_id = ? ORDER BY score DESC LIMIT 10", 
                 (user_id,), fetch_all=True
             )
 
-            leaderboard = "LOCAL_LEADERBOARD|" + "|".join([str(row[0]) for row in rows])
-            return leaderboard
+            return ("LOCAL_LEADERBOARD", *[row[0] for row in rows])
         except jwt.ExpiredSignatureError:
-            return "ERROR|Token expired"
+            return ("ERROR", "Token expired")
         except Exception as e:
-            return f"ERROR|{str(e)}"
+            return ("ERROR", str(e))
 
     def get_stats(self, token):
         """Retrieve player's game statistics (highest score, total games played, average score)."""
         try:
-            decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            user_id = decoded["user_id"]
-
-            highest_score = self.execute_query(
-                "SELECT MAX(score) FROM scores WHERE user_id = ?", 
-                (user_id,), fetch_one=True
-            )[0] or 0
+            user_id = self.tokens.verify(token)
 
-            total_games = self.execute_query(
-                "SELECT COUNT(*) FROM scores WHERE user_id = ?", 
+            row = self.execute_query(
+                "SELECT best, games, total FROM user_stats WHERE user_id = ?",
                 (user_id,), fetch_one=True
-            )[0] or 0
-
-            avg_score = self.execute_query(
-                "SELECT AVG(score) FROM scores WHERE user_id = ?", 
-                (user_id,), fetch_one=True
-            )[0] or 0
+            )
+            highest_score, total_games, total_score = row or (0, 0, 0)
+            avg_score = total_score / total_games if total_games else 0
 
-            return f"STATS|Highest Score: {highest_score} | Total Games: {total_games} | Average Score: {round(avg_score, 2)}"
+            return ("STATS", f"Highest Score: {highest_score} ", f" Total Games: {total_games} ",
+                    f" Average Score: {round(avg_score, 2)}")
         except jwt.ExpiredSignatureError:
-            return "ERROR|Token expired"
+            return ("ERROR", "Token expired")
         except Exception as e:
-            return f"ERROR|{str(e)}"
+            return ("ERROR", str(e))
+
+def build_server(cli_args, **overrides):
+    """Construct a GameServer from parsed command-line options."""
+    options = dict(
+        db_name=cli_args.db,
+        max_batch=cli_args.batch_size, max_delay=cli_args.batch_delay,
+        hash_workers=cli_args.hash_workers, hash_queue=cli_args.hash_queue,
+        bcrypt_rounds=cli_args.bcrypt_rounds, read_pool_size=cli_args.read_pool,
+        connection_rate=cli_args.conn_rate, ip_rate=cli_args.ip_rate, user_rate=cli_args.user_rate,
+        max_connections=cli_args.max_connections, idle_timeout=cli_args.idle_timeout,
+        replay_workers=cli_args.replay_workers, replay_queue=cli_args.replay_queue,
+        require_replay=cli_args.require_replay, snapshot_interval=cli_args.snapshot_interval,
+    )
+    options.update(overrides)
+    return GameServer(cli_args.host, cli_args.port, **options)
+
+def run_server(server, mode):
+    """Serve until interrupted, then flush queued scores and release resources."""
+    try:
+        if mode == "asyncio":
+            server.start_async()
+        else:
+            server.start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dropped = server.close()
+        if dropped:
+            print(f"Server stopped; {dropped} queued scores could not be written.")
+        else:
+            print("Server stopped; queued scores flushed.")
 
 if __name__ == "__main__":
-    init_db()
-    server = GameServer()
-    server.start()
+    parser = argparse.ArgumentParser(description="Snake leaderboard server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--db", default=DB_NAME, help="SQLite database file")
+    parser.add_argument("--mode", choices=["thread", "asyncio"], default="thread",
+                        help="thread: one thread per client; asyncio: one event loop for all clients")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="server processes sharing the port via SO_REUSEPORT (Linux/BSD)")
+    parser.add_argument("--batch-size", type=int, default=INGEST_MAX_BATCH,
+                        help="maximum scores written per transaction")
+    parser.add_argument("--batch-delay", type=float, default=INGEST_MAX_DELAY,
+                        help="maximum seconds a score waits before its batch is written")
+    parser.add_argument("--bcrypt-rounds", type=int, default=BCRYPT_ROUNDS,
+                        help="bcrypt cost factor for new password hashes")
+    parser.add_argument("--hash-workers", type=int, default=HASH_WORKERS,
+                        help="processes doing bcrypt work (defaults to CPU count)")
+    parser.add_argument("--hash-queue", type=int, default=HASH_QUEUE_LIMIT,
+                        help="signups/logins admitted at once before answering ERROR|Busy")
+    parser.add_argument("--read-pool", type=int, default=READ_POOL_SIZE,
+                        help="read-only SQLite connections for queries")
+    parser.add_argument("--conn-rate", type=float, default=CONNECTION_RATE,
+                        help="command cost units per second allowed per connection (0 disables)")
+    parser.add_argument("--ip-rate", type=float, default=IP_RATE,
+                        help="command cost units per second shared by one client address (0 disables)")
+    parser.add_argument("--user-rate", type=float, default=USER_RATE,
+                        help="command cost units per second shared by one logged-in user (0 disables)")
+    parser.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS,
+                        help="open connections before new ones are answered ERROR|Server full")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="seconds before a silent connection is closed (0 disables)")
+    parser.add_argument("--replay-workers", type=int, default=REPLAY_WORKERS,
+                        help="processes re-simulating submitted replays")
+    parser.add_argument("--replay-queue", type=int, default=REPLAY_QUEUE_LIMIT,
+                        help="replays admitted at once before answering ERROR|Busy")
+    parser.add_argument("--require-replay", action="store_true",
+                        help="only accept scores submitted with a replay that verifies")
+    parser.add_argument("--snapshot-interval", type=float, default=SNAPSHOT_INTERVAL,
+                        help="seconds between leaderboard snapshots written next to the database "
+                             "for fast restarts (0 writes one only on shutdown)")
+    parser.add_argument("--metrics-port", type=int,
+                        help="also serve Prometheus metrics over HTTP on this local port "
+                             "(worker N of a cluster uses port + N)")
+    cli_args = parser.parse_args()
+
+    # Turn SIGTERM into a normal exit so queued scores are flushed below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    init_db(cli_args.db)
+    if cli_args.workers > 1:
+        from cluster import run_cluster
+        run_cluster(cli_args)
+    else:
+        if cli_args.metrics_port:
+            serve_http(cli_args.metrics_port)
+        run_server(build_server(cli_args), cli_args.mode)
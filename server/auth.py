@@ -0,0 +1,128 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+import jwt
+
+from metrics import REGISTRY
+
+BCRYPT_ROUNDS = 12  # bcrypt cost factor for new password hashes
+HASH_WORKERS = os.cpu_count() or 1  # Processes doing bcrypt work
+HASH_QUEUE_LIMIT = 64  # Hash/verify requests admitted at once before answering "Busy"
+TOKEN_CACHE_SIZE = 10000  # Verified session tokens kept in memory
+
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check_password(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+class PasswordHasher:
+    """Runs bcrypt in a process pool so login bursts don't starve other commands.
+
+    Callers must take a slot with try_acquire() before hashing and release() it
+    afterwards; when all HASH_QUEUE_LIMIT slots are taken the request should be
+    rejected immediately instead of queueing behind the others.
+    """
+
+    def __init__(self, workers=HASH_WORKERS, max_pending=HASH_QUEUE_LIMIT, rounds=BCRYPT_ROUNDS):
+        self.rounds = rounds
+        self.max_pending = max_pending
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.in_flight = 0
+        self.in_flight_lock = threading.Lock()
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def try_acquire(self):
+        """Reserve a hashing slot without blocking; returns False when saturated."""
+        if not self.slots.acquire(blocking=False):
+            return False
+        with self.in_flight_lock:
+            self.in_flight += 1
+        return True
+
+    def release(self):
+        """Return a slot taken with try_acquire()."""
+        with self.in_flight_lock:
+            self.in_flight -= 1
+        self.slots.release()
+
+    def run(self, op, fn, *args):
+        """Run fn in the pool and record how long the caller waited for it."""
+        start = time.perf_counter()
+        try:
+            return self.pool.submit(fn, *args).result()
+        finally:
+            REGISTRY.observe("snake_bcrypt_seconds", time.perf_counter() - start, (("op", op),))
+
+    def hash(self, password):
+        """Hash a password string, returning the bcrypt hash bytes."""
+        return self.run("hash", _hash_password, password.encode(), self.rounds)
+
+    def check(self, password, hashed):
+        """Verify a password string against a stored bcrypt hash."""
+        return self.run("check", _check_password, password.encode(), hashed)
+
+    def close(self):
+        """Stop the worker processes."""
+        self.pool.shutdown(wait=True)
+
+
+class TokenCache:
+    """Bounded LRU cache of verified JWTs mapping token -> (user_id, expiry).
+
+    A session reuses one token for every request, so only the first request pays
+    for HS256 verification. Cached entries are dropped once their expiry passes,
+    and the least recently used entry is evicted when the cache is full.
+    """
+
+    def __init__(self, secret_key, max_size=TOKEN_CACHE_SIZE):
+        self.secret_key = secret_key
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def verify(self, token):
+        """Return the token's user_id, raising jwt errors for invalid or expired tokens."""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is not None:
+                user_id, expiry = entry
+                if expiry > now:
+                    self.entries.move_to_end(token)
+                    self.hits += 1
+                    return user_id
+                del self.entries[token]
+            self.misses += 1
+
+        decoded = jwt.decode(token, self.secret_key, algorithms=["HS256"])
+        user_id = decoded["user_id"]
+        with self.lock:
+            self.entries[token] = (user_id, decoded.get("exp", float("inf")))
+            self.entries.move_to_end(token)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return user_id
+
+    def lookup(self, token):
+        """Return the user_id of a cached, unexpired token, or None; never verifies a signature."""
+        with self.lock:
+            entry = self.entries.get(token)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def stats(self):
+        """Return (hits, misses, cached entries)."""
+        with self.lock:
+            return self.hits, self.misses, len(self.entries)
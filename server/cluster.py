@@ -0,0 +1,205 @@
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+from concurrent.futures import Future
+
+from auth import HASH_WORKERS
+from database import DB_NAME
+from ingest import ScoreWriter
+from snapshot import SnapshotWriter, snapshot_path
+
+BROADCAST_BATCH = 1000  # Messages drained from the inbox before scores are fanned out
+
+
+class RemoteScoreWriter:
+    """ScoreWriter stand-in used by workers: forwards every write to the writer process.
+
+    Scores are fire-and-forget like ScoreWriter.submit(); execute() waits for the
+    writer to send back the statement's result (or exception). Scores with a
+    client id come back to every worker, this one included, once written.
+    """
+
+    def __init__(self, worker_id, inbox):
+        self.worker_id = worker_id
+        self.inbox = inbox
+        self.job_ids = itertools.count()
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.submitted = 0
+
+    def submit(self, user_id, score, played_at=None, client_id=None):
+        """Send a score to the writer process."""
+        self.submitted += 1
+        self.inbox.put(("score", self.worker_id, user_id, score, played_at, client_id))
+
+    def execute(self, query, params=()):
+        """Run a write statement in the writer process and return its lastrowid."""
+        future = Future()
+        with self.lock:
+            job_id = next(self.job_ids)
+            self.futures[job_id] = future
+        self.inbox.put(("write", self.worker_id, job_id, query, params))
+        return future.result()
+
+    def resolve(self, job_id, result, error):
+        """Complete the execute() call waiting on job_id."""
+        with self.lock:
+            future = self.futures.pop(job_id)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def pending(self):
+        """Scores are queued in the writer process, so nothing is pending locally."""
+        return 0
+
+    def close(self):
+        """Make sure every score put on the inbox has been handed to the pipe."""
+        self.inbox.close()
+        self.inbox.join_thread()
+
+
+def listen_for_updates(server, writer, outbox):
+    """Worker thread: apply scores accepted by other workers and resolve write results."""
+    while True:
+        message = outbox.get()
+        if message is None:
+            return
+        kind = message[0]
+        if kind == "scores":
+            for user_id, score, played_at in message[1]:
+                server.record_score(user_id, score, played_at)
+        elif kind == "result":
+            _, job_id, result, error = message
+            writer.resolve(job_id, result, error)
+
+
+def run_worker(worker_id, cli_args, inbox, outbox, hash_workers):
+    """Entry point of a worker process: serve clients on the shared SO_REUSEPORT port."""
+    from app import build_server, run_server
+    from metrics import serve_http
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    writer = RemoteScoreWriter(worker_id, inbox)
+    server = build_server(cli_args, score_writer=writer, reuse_port=True, hash_workers=hash_workers,
+                          replay_workers=max(1, cli_args.replay_workers // cli_args.workers),
+                          write_snapshots=False)
+    threading.Thread(target=listen_for_updates, args=(server, writer, outbox), daemon=True).start()
+    if cli_args.metrics_port:
+        serve_http(cli_args.metrics_port + worker_id)
+    print(f"Worker {worker_id} started (pid {os.getpid()})")
+    run_server(server, cli_args.mode)
+
+
+def run_cluster(cli_args):
+    """Fork cli_args.workers server processes and act as their single database writer.
+
+    Workers accept connections on the same port via SO_REUSEPORT and keep their own
+    leaderboard caches. Every score and write statement is funnelled to this
+    process, which group-commits them and fans accepted scores out to the other
+    workers so their caches stay in sync.
+    """
+    context = multiprocessing.get_context("spawn")
+    inbox = context.Queue()
+    outboxes = [context.Queue() for _ in range(cli_args.workers)]
+    hash_workers = max(1, HASH_WORKERS // cli_args.workers)
+
+    workers = [
+        context.Process(target=run_worker, args=(i, cli_args, inbox, outboxes[i], hash_workers),
+                        name=f"snake-worker-{i}")
+        for i in range(cli_args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    db_name = getattr(cli_args, "db", DB_NAME)
+    writer = ScoreWriter(db_name, cli_args.batch_size, cli_args.batch_delay,
+                         lambda rows: fan_out_written(outboxes, rows))
+    snapshots = SnapshotWriter(db_name, snapshot_path(db_name), cli_args.snapshot_interval)
+    # Stop between pumps: exiting mid-pump would lose the messages already taken off the inbox
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+    try:
+        while not stopping.is_set() and any(worker.is_alive() for worker in workers):
+            pump_inbox(inbox, outboxes, writer, timeout=0.5)
+    finally:
+        writer.on_written = None  # Workers are stopping: nothing more to fan out
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        # Exiting workers flush their queued scores into the inbox and wait for the
+        # pipe to take them, so keep draining it until they are gone
+        while any(worker.is_alive() for worker in workers):
+            pump_inbox(inbox, outboxes, writer, timeout=0.1, reply=False)
+        for worker in workers:
+            worker.join()
+        # Nobody reads the outboxes any more: don't let their feeder threads block exit
+        for outbox in outboxes:
+            outbox.cancel_join_thread()
+        # Write whatever the workers sent last
+        while pump_inbox(inbox, outboxes, writer, timeout=0, reply=False):
+            pass
+        dropped = writer.close()
+        snapshots.close()
+        if dropped:
+            print(f"Cluster stopped; {dropped} queued scores could not be written.")
+        else:
+            print("Cluster stopped; queued scores flushed.")
+
+
+def pump_inbox(inbox, outboxes, writer, timeout, reply=True):
+    """Handle up to BROADCAST_BATCH inbox messages; returns how many were handled.
+
+    With reply=False (the workers have exited) nothing is sent back: no write
+    results and no fan-out of accepted scores.
+    """
+    try:
+        messages = [inbox.get(timeout=timeout) if timeout else inbox.get_nowait()]
+    except queue.Empty:
+        return 0
+    while len(messages) < BROADCAST_BATCH:
+        try:
+            messages.append(inbox.get_nowait())
+        except queue.Empty:
+            break
+
+    accepted = []  # (origin worker, user_id, score, played_at)
+    for message in messages:
+        kind = message[0]
+        if kind == "score":
+            _, origin, user_id, score, played_at, client_id = message
+            writer.submit(user_id, score, played_at, client_id)
+            if client_id is None:  # Otherwise fanned out once written, in case it is a resend
+                accepted.append((origin, user_id, score, played_at))
+        elif kind == "write":
+            _, origin, job_id, query, params = message
+            try:
+                result = ("result", job_id, writer.execute(query, params), None)
+            except Exception as e:
+                result = ("result", job_id, None, e)
+            if reply:
+                outboxes[origin].put(result)
+
+    if not reply:
+        return len(messages)
+
+    # One message per worker per pump, without echoing a worker's own scores back
+    for worker_id, outbox in enumerate(outboxes):
+        updates = [(user_id, score, played_at) for origin, user_id, score, played_at in accepted
+                   if origin != worker_id]
+        if updates:
+            outbox.put(("scores", updates))
+    return len(messages)
+
+
+def fan_out_written(outboxes, rows):
+    """Score writer callback: send scores written with a client id to every worker, their origin included."""
+    updates = [(user_id, score, played_at) for user_id, score, played_at, _ in rows]
+    for outbox in outboxes:
+        outbox.put(("scores", updates))
@@ -1,17 +1,84 @@
+import pathlib
+import queue
 import sqlite3
+import time
+from contextlib import contextmanager
+
+from metrics import REGISTRY
 
 DB_NAME = "snake_game.db"
+READ_POOL_SIZE = 8  # Read-only connections shared by request handlers
+STATEMENT_CACHE_SIZE = 256  # Prepared statements kept per connection
+
+# Per-connection tuning applied to every connection the server opens
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",  # Map up to 256 MiB of the file instead of copying pages
+    "PRAGMA cache_size=-65536",  # 64 MiB page cache
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def configure_connection(conn):
+    """Apply CONNECTION_PRAGMAS to a freshly opened connection and return it."""
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ReadPool:
+    """Fixed set of read-only connections for queries.
+
+    In WAL mode readers never block the writer or each other, so a query borrows a
+    connection instead of serialising behind a global lock. Each connection keeps
+    its prepared statements cached, so the server's fixed queries are parsed once.
+    """
+
+    def __init__(self, db_name=DB_NAME, size=READ_POOL_SIZE):
+        uri = pathlib.Path(db_name).absolute().as_uri() + "?mode=ro"
+        self.connections = queue.LifoQueue()
+        for _ in range(size):
+            self.connections.put(configure_connection(sqlite3.connect(
+                uri, uri=True, timeout=10, check_same_thread=False,
+                cached_statements=STATEMENT_CACHE_SIZE
+            )))
+        self.size = size
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, waiting if all of them are in use."""
+        start = time.perf_counter()
+        conn = self.connections.get()
+        REGISTRY.observe("snake_db_pool_wait_seconds", time.perf_counter() - start)
+        try:
+            yield conn
+        finally:
+            self.connections.put(conn)
+
+    def execute(self, query, params=(), fetch_one=False, fetch_all=False):
+        """Run a read query on a pooled connection."""
+        with self.connection() as conn:
+            cursor = conn.execute(query, params)
+            if fetch_one:
+                return cursor.fetchone()
+            if fetch_all:
+                return cursor.fetchall()
+            return None
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    def close(self):
+        """Close every pooled connection."""
+        for _ in range(self.size):
+            self.connections.get().close()
 
-    
+
+def migrate_base_schema(cursor):
+    """1: users and scores tables, including the email column older databases lack."""
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS users (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL
+        password TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL
     )
     """)
 
@@ -24,37 +91,103 @@ def init_db():
     )
     """)
 
-    
     cursor.execute("PRAGMA table_info(users)")
     columns = [column[1] for column in cursor.fetchall()]
-    
     if "email" not in columns:
         print("Updating database schema: Adding 'email' column to users table.")
-        
-        
-        cursor.execute("ALTER TABLE users RENAME TO users_old")
-
-        
-        cursor.execute("""
-        CREATE TABLE users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            email TEXT UNIQUE
-        )
-        """)
-
-        
-        cursor.execute("""
-        INSERT INTO users (id, username, password)
-        SELECT id, username, password FROM users_old
-        """)
-
-       
-        cursor.execute("DROP TABLE users_old")
-
-    conn.commit()
+        cursor.execute("ALTER TABLE users ADD COLUMN email TEXT")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users(email)")
+
+
+def migrate_score_indexes(cursor):
+    """2: covering index for per-user score lookups (LOCAL_LEADERBOARD, backfills)."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scores_user_score ON scores(user_id, score DESC)")
+
+
+def migrate_user_stats(cursor):
+    """3: per-user aggregates maintained by ScoreWriter alongside every score insert."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS user_stats (
+        user_id INTEGER PRIMARY KEY,
+        best INTEGER NOT NULL,
+        games INTEGER NOT NULL,
+        total INTEGER NOT NULL,
+        last_played INTEGER,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )
+    """)
+    # Backfill players the table doesn't know yet; streams idx_scores_user_score
+    cursor.execute("""
+    INSERT OR IGNORE INTO user_stats (user_id, best, games, total)
+    SELECT user_id, MAX(score), COUNT(*), SUM(score) FROM scores GROUP BY user_id
+    """)
+
+
+def migrate_score_timestamps(cursor):
+    """4: stamp scores on ingestion and keep per-window best scores for daily/weekly boards."""
+    cursor.execute("PRAGMA table_info(scores)")
+    if "created_at" not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE scores ADD COLUMN created_at INTEGER")  # NULL for older rows
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS leaderboard_buckets (
+        period TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        best INTEGER NOT NULL,
+        PRIMARY KEY (period, bucket, user_id)
+    ) WITHOUT ROWID
+    """)
+
+
+def migrate_score_client_ids(cursor):
+    """5: client-chosen ids of batched scores, so a resent batch is only written once."""
+    cursor.execute("PRAGMA table_info(scores)")
+    if "client_id" not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE scores ADD COLUMN client_id TEXT")  # NULL when sent without one
+    cursor.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_scores_client_id ON scores(user_id, client_id)
+    WHERE client_id IS NOT NULL
+    """)
+
+
+# Applied in order; PRAGMA user_version records how many have run.
+# Each step must be idempotent so databases from before versioning upgrade cleanly.
+MIGRATIONS = [
+    migrate_base_schema,
+    migrate_score_indexes,
+    migrate_user_stats,
+    migrate_score_timestamps,
+    migrate_score_client_ids,
+]
+
+
+def migrate(conn):
+    """Apply every migration newer than the database's user_version, one transaction each."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        print(f"Applied migration {number}: {migration.__name__}")
+
+
+def init_db(db_name=DB_NAME):
+    """Initialize the database: enable WAL and bring the schema up to date."""
+    conn = sqlite3.connect(db_name, timeout=10, isolation_level=None)
+    configure_connection(conn)
+
+    # Enable WAL mode for concurrent reads/writes (persists in the database file)
+    conn.execute("PRAGMA journal_mode=WAL")
+    migrate(conn)
+
     conn.close()
+    print("[✔] Database initialized successfully.")
 
 if __name__ == "__main__":
     init_db()
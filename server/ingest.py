@@ -0,0 +1,241 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from database import configure_connection
+from leaderboard import WINDOW_BUCKETS
+from metrics import REGISTRY
+
+INGEST_MAX_BATCH = 500  # Scores written per transaction at most
+INGEST_MAX_DELAY = 0.05  # Seconds a queued score may wait for its batch to fill
+
+_STOP = object()
+
+WINDOW_RETENTION = 1  # Closed buckets kept per window (e.g. yesterday's daily board)
+
+INSERT_SCORE = "INSERT INTO scores (user_id, score, created_at, client_id) VALUES (?, ?, ?, ?)"
+SELECT_CLIENT_ID = "SELECT 1 FROM scores WHERE user_id = ? AND client_id = ?"
+UPSERT_BUCKET = """
+    INSERT INTO leaderboard_buckets (period, bucket, user_id, best)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(period, bucket, user_id) DO UPDATE SET best = MAX(best, excluded.best)
+"""
+PURGE_BUCKETS = "DELETE FROM leaderboard_buckets WHERE period = ? AND bucket < ?"
+# Resent queued scores carry their original played_at, so last_played must never move backwards
+UPSERT_STATS = """
+    INSERT INTO user_stats (user_id, best, games, total, last_played)
+    VALUES (?, ?, 1, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        best = MAX(best, excluded.best),
+        games = games + 1,
+        total = total + excluded.total,
+        last_played = MAX(COALESCE(last_played, 0), excluded.last_played)
+"""
+
+
+class _WriteJob:
+    """A one-off write statement queued behind scores, with a future for its result."""
+
+    def __init__(self, query, params):
+        self.query = query
+        self.params = params
+        self.future = Future()
+        self.queued_at = time.perf_counter()
+
+
+class ScoreWriter:
+    """Background writer that owns the server's only write connection.
+
+    submit() only enqueues, so callers are acknowledged without waiting on fsync.
+    A score may carry the client's id for it; one whose id was already written
+    (a batch resent after its reply was lost) is skipped, so it counts once.
+    Only the writer knows which such scores it inserted, so it hands them to
+    on_written(rows) once their batch has committed.
+    A single thread drains the queue and writes each batch, together with the
+    matching user_stats and time-window bucket updates, in one transaction;
+    close() flushes everything
+    still queued before returning. Other writes (e.g. signups) go through
+    execute() so SQLite never sees two writers competing for its lock.
+    """
+
+    def __init__(self, db_name, max_batch=INGEST_MAX_BATCH, max_delay=INGEST_MAX_DELAY, on_written=None):
+        self.db_name = db_name
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.on_written = on_written  # Called on the writer thread with the inserted rows that had a client id
+        self.queue = queue.Queue()
+        self.conn = configure_connection(sqlite3.connect(db_name, timeout=10, check_same_thread=False))
+
+        self.submitted = 0
+        self.written = 0
+        self.batches = 0
+        self.newest_buckets = {}  # period -> newest bucket written, to purge closed ones
+        self.lock = threading.Lock()  # Orders execute() against the writer thread stopping
+        self.stopped = False
+        self.dropped = 0  # Scores still queued when the writer thread stopped
+
+        self.thread = threading.Thread(target=self.run, name="score-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, user_id, score, played_at=None, client_id=None):
+        """Queue a score (stamped now unless played_at is given) for the next batch."""
+        self.submitted += 1
+        if self.stopped:
+            self.dropped += 1
+            return
+        self.queue.put((user_id, score, int(time.time()) if played_at is None else played_at, client_id))
+
+    def execute(self, query, params=()):
+        """Run a single write statement on the writer thread and return its lastrowid."""
+        job = _WriteJob(query, params)
+        with self.lock:
+            if self.stopped:
+                raise RuntimeError("Score writer stopped")
+            self.queue.put(job)
+        return job.future.result()
+
+    def pending(self):
+        """Return the number of scores waiting to be written."""
+        return self.queue.qsize()
+
+    def close(self):
+        """Flush all queued scores, stop the writer thread and return how many scores could not be written."""
+        self.queue.put(_STOP)
+        self.thread.join()
+        return self.dropped
+
+    def run(self):
+        """Collect batches until max_batch or max_delay is reached, then write them."""
+        stopping = False
+        try:
+            while not stopping:
+                item = self.queue.get()
+                batch = []
+                deadline = time.monotonic() + self.max_delay
+                while item is not None:
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    if isinstance(item, _WriteJob):
+                        self.write_batch(self.conn, batch)
+                        batch = []
+                        self.run_job(item)
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.max_batch:
+                        break
+                    item = self.next_item(deadline)
+                self.write_batch(self.conn, batch)
+        finally:
+            self.fail_pending()
+            self.conn.close()
+
+    def fail_pending(self):
+        """Refuse new writes and fail whatever is still queued, so no caller waits forever."""
+        with self.lock:
+            self.stopped = True
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, _WriteJob):
+                item.future.set_exception(RuntimeError("Score writer stopped"))
+            elif item is not _STOP:
+                self.dropped += 1
+        if self.dropped:
+            print(f"Score writer stopped with {self.dropped} scores unwritten")
+
+    def next_item(self, deadline):
+        """Return the next queued item, or None once the batch deadline passes."""
+        remaining = deadline - time.monotonic()
+        try:
+            return self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def run_job(self, job):
+        """Execute a one-off write in its own transaction and resolve its future."""
+        REGISTRY.observe("snake_db_writer_wait_seconds", time.perf_counter() - job.queued_at)
+        try:
+            with self.conn:
+                cursor = self.conn.execute(job.query, job.params)
+            job.future.set_result(cursor.lastrowid)
+        except Exception as e:
+            job.future.set_exception(e)
+
+    def insert_rows(self, conn, rows):
+        """Insert (user_id, score, played_at, client_id) rows and fold them into user_stats and window buckets.
+
+        Returns the rows actually inserted.
+        """
+        rows = self.unwritten(conn, rows)
+        if not rows:
+            return rows
+        conn.executemany(INSERT_SCORE, rows)
+        conn.executemany(UPSERT_STATS, [(user_id, score, score, played_at) for user_id, score, played_at, _ in rows])
+        for period, bucket_of in WINDOW_BUCKETS.items():
+            buckets = [(period, bucket_of(played_at), user_id, score) for user_id, score, played_at, _ in rows]
+            conn.executemany(UPSERT_BUCKET, buckets)
+            newest = max(bucket for _, bucket, _, _ in buckets)
+            if newest > self.newest_buckets.get(period, newest - 1):
+                # A new window opened: drop buckets that fell out of retention (PK range delete)
+                conn.execute(PURGE_BUCKETS, (period, newest - WINDOW_RETENTION))
+                self.newest_buckets[period] = newest
+        return rows
+
+    @staticmethod
+    def unwritten(conn, rows):
+        """Drop rows whose client id is already in scores or earlier in rows."""
+        fresh = []
+        seen = set()
+        for row in rows:
+            user_id, _, _, client_id = row
+            if client_id is not None:
+                key = (user_id, client_id)
+                if key in seen or conn.execute(SELECT_CLIENT_ID, key).fetchone() is not None:
+                    continue
+                seen.add(key)
+            fresh.append(row)
+        return fresh
+
+    def write_batch(self, conn, batch):
+        """Insert a batch in a single transaction, falling back to row-by-row on failure."""
+        if not batch:
+            return
+        start = time.perf_counter()
+        try:
+            with conn:
+                inserted = self.insert_rows(conn, batch)
+            REGISTRY.observe("snake_db_batch_commit_seconds", time.perf_counter() - start)
+            written = len(batch)
+        except Exception as e:  # e.g. sqlite3.Error, or OverflowError for an out-of-range value
+            print(f"Batch insert of {len(batch)} scores failed ({e}); retrying individually")
+            inserted = []
+            written = 0
+            for row in batch:
+                try:
+                    with conn:
+                        inserted += self.insert_rows(conn, [row])
+                except Exception as row_error:
+                    print(f"Dropping score {row}: {row_error}")
+                    continue
+                written += 1
+        self.written += written
+        self.batches += 1
+        if written:
+            REGISTRY.inc("snake_scores_written_total", amount=written)
+        self.report(inserted)
+
+    def report(self, rows):
+        """Pass the inserted rows that carried a client id to on_written."""
+        on_written = self.on_written
+        rows = [row for row in rows if row[3] is not None]
+        if not rows or on_written is None:
+            return
+        try:
+            on_written(rows)
+        except Exception as e:  # Keep the writer thread alive; the rows are already committed
+            print(f"Applying {len(rows)} written scores failed: {e!r}")
@@ -0,0 +1,265 @@
+import bisect
+import threading
+import time
+
+BUCKET_SIZE = 512  # Target keys per RankedList bucket; buckets split at twice this
+
+
+def day_bucket(timestamp):
+    """UTC day number of a unix timestamp."""
+    return timestamp // 86400
+
+
+def week_bucket(timestamp):
+    """Week number of a unix timestamp; weeks start Monday 00:00 UTC (1970-01-01 was a Thursday)."""
+    return (timestamp // 86400 + 3) // 7
+
+
+# Time-windowed leaderboards and how a timestamp maps to each one's bucket
+WINDOW_BUCKETS = {"daily": day_bucket, "weekly": week_bucket}
+
+
+class RankedList:
+    """Sorted list with O(log n) rank lookups and positional access.
+
+    Keys live in sorted buckets of a few hundred entries. A Fenwick tree over the
+    bucket lengths turns "how many keys precede this bucket" into a log-time query;
+    it is rebuilt lazily only when a bucket splits or empties.
+    """
+
+    def __init__(self, keys=()):
+        keys = sorted(keys)
+        self.buckets = [keys[i:i + BUCKET_SIZE] for i in range(0, len(keys), BUCKET_SIZE)]
+        self.maxes = [bucket[-1] for bucket in self.buckets]
+        self.size = len(keys)
+        self.tree = None
+
+    def __len__(self):
+        return self.size
+
+    def build_tree(self):
+        """Rebuild the Fenwick tree over bucket lengths."""
+        tree = [0] + [len(bucket) for bucket in self.buckets]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def tree_add(self, bucket_index, delta):
+        """Adjust one bucket's length in the Fenwick tree, if it is built."""
+        if self.tree is None:
+            return
+        i = bucket_index + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def keys_before(self, bucket_index):
+        """Return how many keys are stored in buckets before bucket_index."""
+        if self.tree is None:
+            self.build_tree()
+        total = 0
+        i = bucket_index
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def locate(self, position):
+        """Return (bucket_index, offset) of the key at a 0-based position."""
+        if self.tree is None:
+            self.build_tree()
+        bucket_index = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            nxt = bucket_index + step
+            if nxt < len(self.tree) and self.tree[nxt] <= position:
+                bucket_index = nxt
+                position -= self.tree[nxt]
+            step >>= 1
+        return bucket_index, position
+
+    def add(self, key):
+        """Insert a key."""
+        self.size += 1
+        if not self.buckets:
+            self.buckets.append([key])
+            self.maxes.append(key)
+            self.tree = None
+            return
+        i = bisect.bisect_left(self.maxes, key)
+        if i == len(self.buckets):
+            i -= 1
+        bucket = self.buckets[i]
+        bisect.insort(bucket, key)
+        self.maxes[i] = bucket[-1]
+        if len(bucket) > 2 * BUCKET_SIZE:
+            self.buckets[i:i + 1] = [bucket[:BUCKET_SIZE], bucket[BUCKET_SIZE:]]
+            self.maxes[i:i + 1] = [bucket[BUCKET_SIZE - 1], bucket[-1]]
+            self.tree = None
+        else:
+            self.tree_add(i, 1)
+
+    def remove(self, key):
+        """Remove a key that is known to be present."""
+        i = bisect.bisect_left(self.maxes, key)
+        bucket = self.buckets[i]
+        del bucket[bisect.bisect_left(bucket, key)]
+        self.size -= 1
+        if bucket:
+            self.maxes[i] = bucket[-1]
+            self.tree_add(i, -1)
+        else:
+            del self.buckets[i]
+            del self.maxes[i]
+            self.tree = None
+
+    def index(self, key):
+        """Return the 0-based position of a key that is known to be present."""
+        i = bisect.bisect_left(self.maxes, key)
+        return self.keys_before(i) + bisect.bisect_left(self.buckets[i], key)
+
+    def slice(self, start, stop):
+        """Return the keys at positions [start, stop) as a list."""
+        start = max(start, 0)
+        stop = min(stop, self.size)
+        if start >= stop:
+            return []
+        bucket_index, offset = self.locate(start)
+        result = []
+        while len(result) < stop - start:
+            bucket = self.buckets[bucket_index]
+            result.extend(bucket[offset:offset + (stop - start - len(result))])
+            bucket_index += 1
+            offset = 0
+        return result
+
+
+class LeaderboardIndex:
+    """In-memory index of every player's best score, kept sorted for top-N reads.
+
+    Entries are ordered by best score descending, ties broken by user id ascending,
+    which matches get_global_leaderboard's SQL ordering.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.best = {}  # user_id -> best score
+        self.usernames = {}  # user_id -> username
+        self.ranking = RankedList()  # Sorted (-best, user_id) keys
+
+    def load(self, cursor):
+        """Build the index from the user_stats aggregates (called once at startup)."""
+        cursor.execute("""
+            SELECT user_stats.user_id, users.username, user_stats.best
+            FROM user_stats
+            JOIN users ON user_stats.user_id = users.id
+        """)
+        self.load_rows(cursor.fetchall())
+
+    def load_rows(self, rows):
+        """Replace the index contents with (user_id, username, best) rows."""
+        with self.lock:
+            self.best = {user_id: best for user_id, _, best in rows}
+            self.usernames = {user_id: username for user_id, username, _ in rows}
+            self.ranking = RankedList((-best, user_id) for user_id, best in self.best.items())
+
+    def has_user(self, user_id):
+        """Return True if the player's username is already cached."""
+        return user_id in self.usernames
+
+    def username(self, user_id):
+        """Return the cached username for a player, or None."""
+        return self.usernames.get(user_id)
+
+    def update(self, user_id, score, username=None):
+        """Record a newly stored score; returns True if it raised the player's best."""
+        with self.lock:
+            if username is not None:
+                self.usernames[user_id] = username
+            old = self.best.get(user_id)
+            if old is not None and score <= old:
+                return False
+            if old is not None:
+                self.ranking.remove((-old, user_id))
+            self.ranking.add((-score, user_id))
+            self.best[user_id] = score
+            return True
+
+    def __len__(self):
+        return len(self.ranking)
+
+    def top(self, n):
+        """Return the best n players as (username, score) pairs."""
+        return self.page(0, n)
+
+    def page(self, offset, limit):
+        """Return players ranked [offset, offset + limit) as (username, score) pairs."""
+        with self.lock:
+            keys = self.ranking.slice(offset, offset + limit)
+            return [(self.usernames[user_id], -neg_score) for neg_score, user_id in keys]
+
+    def rank(self, user_id, neighbours=0):
+        """Return (rank, first_rank, entries) for a player, or None if they have no score.
+
+        rank is 1-based; entries are (username, score) pairs for the players ranked
+        first_rank onward, covering up to `neighbours` places either side of the player.
+        """
+        with self.lock:
+            best = self.best.get(user_id)
+            if best is None:
+                return None
+            position = self.ranking.index((-best, user_id))
+            start = max(position - neighbours, 0)
+            keys = self.ranking.slice(start, position + neighbours + 1)
+            entries = [(self.usernames[uid], -neg_score) for neg_score, uid in keys]
+            return position + 1, start + 1, entries
+
+
+class WindowedLeaderboard:
+    """Best scores per player within the current day or week.
+
+    Only the current bucket is kept in memory; when a score (or read) lands in a
+    newer bucket the old index is simply replaced, so expiring a window is O(1)
+    and never touches historical rows.
+    """
+
+    def __init__(self, period):
+        self.period = period
+        self.bucket_of = WINDOW_BUCKETS[period]
+        self.lock = threading.Lock()
+        self.bucket = self.bucket_of(int(time.time()))
+        self.index = LeaderboardIndex()
+
+    def load(self, cursor):
+        """Load the current bucket from leaderboard_buckets (called once at startup)."""
+        cursor.execute("""
+            SELECT leaderboard_buckets.user_id, users.username, leaderboard_buckets.best
+            FROM leaderboard_buckets
+            JOIN users ON leaderboard_buckets.user_id = users.id
+            WHERE leaderboard_buckets.period = ? AND leaderboard_buckets.bucket = ?
+        """, (self.period, self.bucket))
+        self.index.load_rows(cursor.fetchall())
+
+    def current(self, timestamp=None):
+        """Return the index for the bucket containing timestamp (default: now), rolling over if needed."""
+        bucket = self.bucket_of(int(time.time()) if timestamp is None else timestamp)
+        with self.lock:
+            if bucket > self.bucket:
+                self.bucket = bucket
+                self.index = LeaderboardIndex()
+            elif bucket < self.bucket:
+                return None  # Score belongs to a window that has already closed
+            return self.index
+
+    def record(self, user_id, score, played_at, username):
+        """Apply a score stamped with played_at; returns True if it changed the window's board."""
+        index = self.current(played_at)
+        return index is not None and index.update(user_id, score, username)
+
+    def top(self, n):
+        index = self.current()
+        if index is None:  # Clock stepped back behind the newest score; keep serving that window
+            index = self.index
+        return index.top(n)
@@ -0,0 +1,289 @@
+import itertools
+import struct
+
+# Every message is framed as: payload length (4 bytes) | request id (4 bytes) | payload
+HEADER = struct.Struct("!II")
+MAX_FRAME_SIZE = 1 << 20  # Keeps the first header byte 0, which legacy text commands never start with
+
+# A message is a sequence of fields: str, int, or a tuple of those (an entry such as
+# username:score). The text encoding joins fields with "|" and entry items with ":".
+# The binary encoding, negotiated per connection with HELLO|binary, tags each field:
+#   b int8 | h int16 | i int32 | q int64 (the smallest that fits is used)
+#   a uint8 length + UTF-8 | s uint16 length + UTF-8 | S uint32 length + UTF-8
+#   w uint8 index into WORDS | e uint8 item count followed by the entry's items
+# WORDS is append-only: indexes are part of the wire format.
+#
+# The most frequent messages skip the per-field tags and use a fixed struct layout,
+# flagged by a first byte of 0x80 or above (field tags are ASCII):
+#   0x80 SUBMIT_SCORE: score int32 | token uint16 length + UTF-8
+#   0x81 ranked entries, i.e. a word, some int fields, then (username, score) entries
+#        (leaderboards, LEADERBOARD_PAGE, RANK): word index uint8 | int count uint8 |
+#        entry count uint16 | the ints and then every score as int32 |
+#        username lengths as uint8 | the usernames' UTF-8, concatenated
+# A message that doesn't fit its layout (e.g. a score beyond int32) falls back to tags.
+WORDS = (
+    "SUCCESS", "ERROR", "HELLO", "SIGNUP", "LOGIN", "SUBMIT_SCORE",
+    "GLOBAL_LEADERBOARD", "DAILY_LEADERBOARD", "WEEKLY_LEADERBOARD", "LEADERBOARD_PAGE", "RANK",
+    "LOCAL_LEADERBOARD", "STATS", "METRICS", "SUBSCRIBE_LEADERBOARD", "UNSUBSCRIBE_LEADERBOARD",
+    "SUBSCRIBED", "LEADERBOARD_DIFF", "SUBMIT_SCORES", "SUBMIT_REPLAY",
+)
+WORD_INDEX = {word: index for index, word in enumerate(WORDS)}
+INT8 = struct.Struct("!b")
+INT16 = struct.Struct("!h")
+INT32 = struct.Struct("!i")
+INT64 = struct.Struct("!q")
+LEN16 = struct.Struct("!H")
+LEN32 = struct.Struct("!I")
+
+SUBMIT_SCORE_LAYOUT = 0x80
+SUBMIT_SCORE_HEADER = struct.Struct("!BiH")
+RANKED_LAYOUT = 0x81
+RANKED_HEADER = struct.Struct("!BBBH")
+# Int fields before the entries of each message sent with the ranked layout
+RANKED_INTS = {
+    "GLOBAL_LEADERBOARD": 0, "DAILY_LEADERBOARD": 0, "WEEKLY_LEADERBOARD": 0,
+    "LEADERBOARD_PAGE": 2, "RANK": 3,
+}
+
+
+class FrameError(Exception):
+    """Raised when a peer sends a frame that violates the wire protocol."""
+
+
+def encode_frame(request_id, payload):
+    """Build a frame for a UTF-8 string or bytes payload."""
+    if isinstance(payload, str):
+        payload = payload.encode()
+    if len(payload) > MAX_FRAME_SIZE:
+        raise FrameError(f"Frame of {len(payload)} bytes exceeds {MAX_FRAME_SIZE}")
+    return HEADER.pack(len(payload), request_id) + payload
+
+
+def encode_text(message):
+    """Encode a message as pipe-delimited UTF-8."""
+    return "|".join(
+        ":".join(map(str, field)) if isinstance(field, tuple) else str(field) for field in message
+    ).encode()
+
+
+def decode_text(payload):
+    """Split a pipe-delimited payload into string fields."""
+    try:
+        return payload.decode().split("|")
+    except UnicodeDecodeError as e:
+        raise FrameError(f"Malformed text message: {e}") from None
+
+
+def encode_binary(message):
+    """Encode a message in its fixed layout if it has one, else with tagged binary fields."""
+    command = message[0]
+    if command == "SUBMIT_SCORE":
+        payload = _pack_submit_score(message)
+    elif command in RANKED_INTS:
+        payload = _pack_ranked(message, RANKED_INTS[command])
+    else:
+        payload = None
+    if payload is not None:
+        return payload
+    out = bytearray()
+    for field in message:
+        _encode_field(out, field)
+    return bytes(out)
+
+
+def _encode_field(out, field):
+    if isinstance(field, tuple):
+        out += b"e" + bytes((len(field),))
+        for item in field:
+            _encode_field(out, item)
+    elif isinstance(field, int):
+        if -0x80 <= field <= 0x7F:
+            out += b"b" + INT8.pack(field)
+        elif -0x8000 <= field <= 0x7FFF:
+            out += b"h" + INT16.pack(field)
+        elif -0x80000000 <= field <= 0x7FFFFFFF:
+            out += b"i" + INT32.pack(field)
+        else:
+            out += b"q" + INT64.pack(field)
+    else:
+        field = str(field)
+        index = WORD_INDEX.get(field)
+        if index is not None:
+            out += b"w" + bytes((index,))
+            return
+        data = field.encode()
+        if len(data) <= 0xFF:
+            out += b"a" + bytes((len(data),)) + data
+        elif len(data) <= 0xFFFF:
+            out += b"s" + LEN16.pack(len(data)) + data
+        else:
+            out += b"S" + LEN32.pack(len(data)) + data
+
+
+def _pack_submit_score(message):
+    try:
+        _, token, score = message
+        token = token.encode()
+        return SUBMIT_SCORE_HEADER.pack(SUBMIT_SCORE_LAYOUT, score, len(token)) + token
+    except (ValueError, TypeError, AttributeError, struct.error):
+        return None  # Not this layout's shape
+
+
+def _pack_ranked(message, int_count):
+    try:
+        entries = message[int_count + 1:]
+        names = [name.encode() for name, _ in entries]
+        numbers = [*message[1:int_count + 1], *[score for _, score in entries]]
+        return b"".join((
+            RANKED_HEADER.pack(RANKED_LAYOUT, WORD_INDEX[message[0]], int_count, len(entries)),
+            struct.pack(f"!{len(numbers)}i", *numbers),
+            bytes(map(len, names)),
+            *names,
+        ))
+    except (ValueError, TypeError, AttributeError, struct.error):
+        return None  # Not this layout's shape, e.g. a username over 255 bytes
+
+
+def _unpack_submit_score(payload):
+    _, score, length = SUBMIT_SCORE_HEADER.unpack_from(payload)
+    if SUBMIT_SCORE_HEADER.size + length != len(payload):
+        raise FrameError("SUBMIT_SCORE length mismatch")
+    return ["SUBMIT_SCORE", payload[SUBMIT_SCORE_HEADER.size:].decode(), score]
+
+
+def _unpack_ranked(payload):
+    _, word, int_count, entry_count = RANKED_HEADER.unpack_from(payload)
+    numbers = struct.unpack_from(f"!{int_count + entry_count}i", payload, RANKED_HEADER.size)
+    position = RANKED_HEADER.size + 4 * len(numbers)
+    lengths = payload[position:position + entry_count]
+    names = payload[position + entry_count:]
+    if len(lengths) != entry_count or sum(lengths) != len(names):
+        raise FrameError("Ranked entries length mismatch")
+    ends = list(itertools.accumulate(lengths))
+    text = names.decode()
+    if len(text) == len(names):  # ASCII: character offsets equal byte offsets
+        usernames = [text[start:end] for start, end in zip([0] + ends, ends)]
+    else:
+        usernames = [names[start:end].decode() for start, end in zip([0] + ends, ends)]
+    return [WORDS[word], *numbers[:int_count], *zip(usernames, numbers[int_count:])]
+
+
+def decode_binary(payload):
+    """Decode a binary payload into a list of fields (entries become tuples)."""
+    fields = []
+    position = 0
+    try:
+        if payload and payload[0] == SUBMIT_SCORE_LAYOUT:
+            return _unpack_submit_score(payload)
+        if payload and payload[0] == RANKED_LAYOUT:
+            return _unpack_ranked(payload)
+        while position < len(payload):
+            field, position = _decode_field(payload, position)
+            fields.append(field)
+    except (IndexError, struct.error, UnicodeDecodeError) as e:
+        raise FrameError(f"Malformed binary message: {e}") from None
+    if not fields:
+        raise FrameError("Empty binary message")
+    return fields
+
+
+def _decode_field(payload, position):
+    tag = payload[position]
+    position += 1
+    # Most frequent tags first
+    if tag == 0x61:  # a
+        end = position + 1 + payload[position]
+        return _decode_str(payload, position + 1, end), end
+    if tag == 0x68:  # h
+        return INT16.unpack_from(payload, position)[0], position + 2
+    if tag == 0x62:  # b
+        return INT8.unpack_from(payload, position)[0], position + 1
+    if tag == 0x69:  # i
+        return INT32.unpack_from(payload, position)[0], position + 4
+    if tag == 0x73:  # s
+        end = position + 2 + LEN16.unpack_from(payload, position)[0]
+        return _decode_str(payload, position + 2, end), end
+    if tag == 0x77:  # w
+        return WORDS[payload[position]], position + 1
+    if tag == 0x65:  # e
+        count = payload[position]
+        position += 1
+        items = []
+        for _ in range(count):
+            item, position = _decode_field(payload, position)
+            items.append(item)
+        return tuple(items), position
+    if tag == 0x71:  # q
+        return INT64.unpack_from(payload, position)[0], position + 8
+    if tag == 0x53:  # S
+        end = position + 4 + LEN32.unpack_from(payload, position)[0]
+        return _decode_str(payload, position + 4, end), end
+    raise FrameError(f"Unknown field tag {tag:#x}")
+
+
+def _decode_str(payload, start, end):
+    if end > len(payload):
+        raise FrameError("String field runs past the end of the message")
+    return payload[start:end].decode()
+
+
+# Encodings a framed connection can switch to with HELLO|<name>: name -> (encode, decode)
+CODECS = {
+    "text": (encode_text, decode_text),
+    "binary": (encode_binary, decode_binary),
+}
+
+
+def encode_reply(request_id, encode, message):
+    """Frame an encoded response, or an ERROR in its place if it can't be encoded or framed."""
+    try:
+        return encode_frame(request_id, encode(message))
+    except (FrameError, ValueError, TypeError, OverflowError, struct.error) as e:
+        print(f"Response {message[0]} not sent: {e}")
+        return encode_frame(request_id, encode(("ERROR", "Response could not be encoded")))
+
+
+def is_framed(first_byte):
+    """Return True if a connection's first byte starts a frame rather than a legacy text command."""
+    return first_byte[0] == 0
+
+
+def recv_exact(sock, size):
+    """Read exactly size bytes from a blocking socket, or return None on EOF."""
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+def read_frame(sock):
+    """Read one (request_id, payload) frame from a blocking socket, or None on EOF."""
+    header = recv_exact(sock, HEADER.size)
+    if header is None:
+        return None
+    length, request_id = HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise FrameError(f"Frame of {length} bytes exceeds {MAX_FRAME_SIZE}")
+    payload = recv_exact(sock, length)
+    if payload is None:
+        return None
+    return request_id, payload
+
+
+async def read_frame_async(reader, prefix=b""):
+    """Read one (request_id, payload) frame from an asyncio stream, or None on EOF.
+
+    prefix holds header bytes the caller already consumed (e.g. to sniff the protocol).
+    """
+    try:
+        header = prefix + await reader.readexactly(HEADER.size - len(prefix))
+        length, request_id = HEADER.unpack(header)
+        if length > MAX_FRAME_SIZE:
+            raise FrameError(f"Frame of {length} bytes exceeds {MAX_FRAME_SIZE}")
+        payload = await reader.readexactly(length)
+    except EOFError:  # asyncio.IncompleteReadError subclasses EOFError
+        return None
+    return request_id, payload
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import OrderedDict
+
+CONNECTION_RATE = 20.0  # Cost units refilled per second for each connection (0 disables)
+IP_RATE = 200.0  # Cost units refilled per second shared by all connections from one address (0 disables)
+USER_RATE = 50.0  # Cost units refilled per second shared by all sessions of one user (0 disables)
+BURST_SECONDS = 2.0  # Buckets hold this many seconds of refill, so short bursts pass
+MAX_TRACKED_IPS = 65536  # Per-address buckets kept; least recently seen addresses are forgotten first
+MAX_TRACKED_USERS = 65536  # Per-user buckets kept, likewise
+MAX_CONNECTIONS = 10000  # Open connections before new ones are answered "Server full"
+IDLE_TIMEOUT = 300.0  # Seconds a connection may stay silent before it is closed (subscribers exempt)
+
+# Relative cost of each command; bcrypt and SQL-backed commands drain buckets faster
+COMMAND_COSTS = {
+    "SIGNUP": 10,
+    "LOGIN": 10,
+    "SUBMIT_SCORES": 5,
+    "SUBMIT_REPLAY": 2,
+    "LOCAL_LEADERBOARD": 2,
+    "STATS": 2,
+    "LEADERBOARD_PAGE": 2,
+    "RANK": 2,
+    "METRICS": 5,
+}
+DEFAULT_COST = 1
+
+
+class TokenBucket:
+    """Classic token bucket refilled lazily on each take()."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost, now):
+        """Remove cost tokens if available; returns False (taking nothing) otherwise."""
+        tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if tokens < cost:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - cost
+        return True
+
+
+class RateLimiter:
+    """Hands out per-connection limits that also share a bucket per client address and per user.
+
+    Each connection drains its own bucket and its address's bucket by the
+    command's cost, so one socket can't hog the server and opening many sockets
+    from one address doesn't get around it either. Commands made with a session
+    token also drain that user's bucket, however many addresses they come from.
+    """
+
+    def __init__(self, connection_rate=CONNECTION_RATE, ip_rate=IP_RATE, user_rate=USER_RATE,
+                 max_ips=MAX_TRACKED_IPS, max_users=MAX_TRACKED_USERS):
+        self.connection_rate = connection_rate
+        self.ip_rate = ip_rate
+        self.user_rate = user_rate
+        self.max_ips = max_ips
+        self.max_users = max_users
+        self.lock = threading.Lock()
+        self.ips = OrderedDict()  # address -> TokenBucket, in least recently used order
+        self.users = OrderedDict()  # user_id -> TokenBucket, likewise
+
+    def connection(self, address):
+        """Return the ConnectionLimit for a new connection from address."""
+        return ConnectionLimit(self, address)
+
+    def take_shared(self, address, user_id, cost, now):
+        """Charge cost to address's bucket and, if user_id is given, the user's; all or nothing."""
+        if self.ip_rate <= 0 and (self.user_rate <= 0 or user_id is None):
+            return True
+        with self.lock:
+            ip_bucket = None
+            if self.ip_rate > 0:
+                ip_bucket = self.bucket(self.ips, address, self.ip_rate, self.max_ips)
+                if not ip_bucket.take(cost, now):
+                    return False
+            if self.user_rate > 0 and user_id is not None:
+                user_bucket = self.bucket(self.users, user_id, self.user_rate, self.max_users)
+                if not user_bucket.take(cost, now):
+                    if ip_bucket is not None:
+                        ip_bucket.tokens += cost  # Refund: the request is not served
+                    return False
+            return True
+
+    @staticmethod
+    def bucket(buckets, key, rate, max_size):
+        """Return key's bucket, creating it and evicting the least recently used one if needed."""
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, rate * BURST_SECONDS)
+            if len(buckets) > max_size:
+                buckets.popitem(last=False)
+        else:
+            buckets.move_to_end(key)
+        return bucket
+
+
+class ConnectionLimit:
+    """Rate limit state of one connection; only ever used by that connection's handler."""
+
+    def __init__(self, limiter, address):
+        self.limiter = limiter
+        self.address = address
+        rate = limiter.connection_rate
+        self.bucket = TokenBucket(rate, rate * BURST_SECONDS) if rate > 0 else None
+
+    def allow(self, command, user_id=None):
+        """Charge command's cost; returns False if the connection, its address or user_id is over its rate."""
+        cost = COMMAND_COSTS.get(command, DEFAULT_COST)
+        now = time.monotonic()
+        if self.bucket is not None and not self.bucket.take(cost, now):
+            return False
+        if not self.limiter.take_shared(self.address, user_id, cost, now):
+            if self.bucket is not None:
+                self.bucket.tokens += cost  # Refund: the request is not served
+            return False
+        return True
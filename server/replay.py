@@ -0,0 +1,173 @@
+import multiprocessing
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from metrics import REGISTRY
+
+# Game rules, mirrored from cleint/engine.py; a replay only verifies if these match the client
+GRID_WIDTH = 40
+GRID_HEIGHT = 30
+START_BODY = ((5, 2), (4, 2), (3, 2))  # Head first
+MIN_SELF_COLLISION_LENGTH = 5
+DIRECTIONS = {"U": (0, -1), "D": (0, 1), "L": (-1, 0), "R": (1, 0)}
+
+REPLAY_WORKERS = max(1, (os.cpu_count() or 1) // 2)  # Processes re-simulating replays
+REPLAY_QUEUE_LIMIT = 256  # Replays admitted at once before answering "Busy"
+MAX_REPLAY_TICKS = 100000  # Longer replays are refused before being simulated
+MAX_SEED = 2 ** 63
+
+# A replay's moves are run-length encoded: the direction of each tick as runs like "R12U3L40"
+MOVES_PATTERN = re.compile(r"(?:[UDLR][1-9][0-9]{0,5})+")
+RUN_PATTERN = re.compile(r"([UDLR])([0-9]+)")
+
+
+def parse_moves(moves):
+    """Decode a moves string into [(direction letter, ticks), ...]; raises ValueError if malformed or too long."""
+    if not MOVES_PATTERN.fullmatch(moves):
+        raise ValueError("Malformed replay")
+    runs = [(letter, int(count)) for letter, count in RUN_PATTERN.findall(moves)]
+    if sum(count for _, count in runs) > MAX_REPLAY_TICKS:
+        raise ValueError("Replay too long")
+    return runs
+
+
+def parse_seed(seed):
+    """Decode a replay seed; raises ValueError if out of range."""
+    seed = int(seed)
+    if not 0 <= seed < MAX_SEED:
+        raise ValueError("Invalid seed")
+    return seed
+
+
+@lru_cache(maxsize=None)
+def _start_state(width, height):
+    """Board of a new game (occupancy, free_cells, free_position), built once per board size."""
+    cells = width * height
+    occupancy = bytearray(cells)
+    free_cells = list(range(cells))
+    free_position = list(range(cells))
+    for x, y in START_BODY:
+        index = y * width + x
+        occupancy[index] += 1
+        if occupancy[index] == 1:
+            position = free_position[index]
+            last = free_cells.pop()
+            if last != index:
+                free_cells[position] = last
+                free_position[last] = position
+    return bytes(occupancy), tuple(free_cells), tuple(free_position)
+
+
+def simulate(seed, runs, width=GRID_WIDTH, height=GRID_HEIGHT):
+    """Replay a game and return its score, or None if it doesn't end (in a crash) exactly on its last tick.
+
+    Same rules and food sequence as SnakeEngine.step() with Random(seed), written
+    as one flat loop over cell indices: no per-tick function calls or tuples.
+    """
+    rng = random.Random(seed)
+    occupancy, free_cells, free_position = _start_state(width, height)
+    occupancy = bytearray(occupancy)
+    free_cells = list(free_cells)
+    free_position = list(free_position)
+    body = deque(y * width + x for x, y in START_BODY)
+    food = free_cells[rng.randrange(len(free_cells))]
+    head_x, head_y = START_BODY[0]
+    score = 0
+    remaining = sum(count for _, count in runs)
+
+    for letter, count in runs:
+        dx, dy = DIRECTIONS[letter]
+        for _ in range(count):
+            remaining -= 1
+            head_x += dx
+            head_y += dy
+            if not (0 <= head_x < width and 0 <= head_y < height):
+                return score if remaining == 0 else None
+
+            head = head_y * width + head_x
+            body.appendleft(head)
+            occupancy[head] += 1
+            if occupancy[head] == 1:
+                position = free_position[head]
+                last = free_cells.pop()
+                if last != head:
+                    free_cells[position] = last
+                    free_position[last] = position
+
+            if head == food:
+                score += 1
+                food = free_cells[rng.randrange(len(free_cells))] if free_cells else -1
+            else:
+                tail = body.pop()
+                occupancy[tail] -= 1
+                if occupancy[tail] == 0:
+                    free_position[tail] = len(free_cells)
+                    free_cells.append(tail)
+
+            if len(body) >= MIN_SELF_COLLISION_LENGTH and occupancy[head] > 1:
+                return score if remaining == 0 else None
+    return None  # The snake was still alive when the replay ended
+
+
+def _verify(seed, runs):
+    start = time.perf_counter()
+    score = simulate(seed, runs)
+    return score, time.perf_counter() - start
+
+
+class ReplayVerifier:
+    """Re-simulates submitted replays in a process pool, off the request path.
+
+    reserve(n) admits n replays or none (when REPLAY_QUEUE_LIMIT would be
+    exceeded, so the caller can answer "Busy"); each admitted replay is then
+    passed to submit(), which returns at once. on_verified(user_id, score,
+    played_at, client_id) is called from the pool's result thread only for
+    replays whose simulation reproduces the claimed score.
+    """
+
+    def __init__(self, on_verified, workers=REPLAY_WORKERS, max_pending=REPLAY_QUEUE_LIMIT):
+        self.on_verified = on_verified
+        self.max_pending = max_pending
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def reserve(self, count):
+        """Admit count replays at once; returns False (admitting none) when saturated."""
+        with self.lock:
+            if self.pending + count > self.max_pending:
+                return False
+            self.pending += count
+            return True
+
+    def submit(self, user_id, score, played_at, seed, runs, client_id=None):
+        """Verify a replay reserved with reserve() and apply its score if it checks out."""
+        future = self.pool.submit(_verify, seed, runs)
+        future.add_done_callback(lambda done: self.finish(done, user_id, score, played_at, client_id))
+
+    def finish(self, future, user_id, score, played_at, client_id=None):
+        with self.lock:
+            self.pending -= 1
+        try:
+            replayed, elapsed = future.result()
+        except Exception as e:  # Pool shut down or worker died
+            print(f"Replay verification failed: {e}")
+            REGISTRY.inc("snake_replays_total", (("result", "error"),))
+            return
+        REGISTRY.observe("snake_replay_verify_seconds", elapsed)
+        if replayed != score:
+            print(f"Rejected replay from user {user_id}: claimed {score}, replay gives {replayed}")
+            REGISTRY.inc("snake_replays_total", (("result", "rejected"),))
+            return
+        REGISTRY.inc("snake_replays_total", (("result", "verified"),))
+        self.on_verified(user_id, score, played_at, client_id)
+
+    def close(self):
+        """Finish verifying admitted replays, then stop the worker processes."""
+        self.pool.shutdown(wait=True)
@@ -0,0 +1,150 @@
+import itertools
+import mmap
+import os
+import pathlib
+import sqlite3
+import struct
+import sys
+import threading
+import zlib
+from array import array
+
+from database import configure_connection
+
+SNAPSHOT_INTERVAL = 300.0  # Seconds between snapshots (0 disables periodic writes)
+SNAPSHOT_VERSION = 2  # 2: the CRC covers the header fields too
+
+# Header: magic | version | byte order of the columns | last score id | player count | CRC32 of the
+# header (packed with a CRC of 0) and the body.
+# The body is columnar so each column loads with one memoryview.cast():
+#   user ids (int64) | best scores (int64) | username end offsets in characters (uint32) | usernames (UTF-8)
+# Players are stored in leaderboard order, so the ranking is rebuilt without re-sorting.
+HEADER = struct.Struct("<4sHBxqII")
+MAGIC = b"SNKS"
+BYTE_ORDERS = {"little": 0, "big": 1}
+
+SNAPSHOT_QUERY = """
+    SELECT user_stats.user_id, users.username, user_stats.best
+    FROM user_stats
+    JOIN users ON user_stats.user_id = users.id
+    ORDER BY user_stats.best DESC, user_stats.user_id
+"""
+
+
+def snapshot_path(db_name):
+    """Snapshot file kept next to a database."""
+    return f"{db_name}.snapshot"
+
+
+def write_snapshot(path, conn):
+    """Write every player's best score as of one consistent read of conn; returns (last score id, players).
+
+    The file is written beside path and moved over it with os.replace(), so
+    readers see either the old snapshot or the new one, never a torn file.
+    """
+    conn.execute("BEGIN")  # One read transaction: the scores and user_stats views agree
+    try:
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM scores").fetchone()[0]
+        rows = conn.execute(SNAPSHOT_QUERY).fetchall()
+    finally:
+        conn.execute("ROLLBACK")
+
+    user_ids = array("q", [user_id for user_id, _, _ in rows])
+    bests = array("q", [best for _, _, best in rows])
+    ends = array("I", itertools.accumulate(len(username) for _, username, _ in rows))
+    names = "".join(username for _, username, _ in rows).encode()
+    body = [user_ids.tobytes(), bests.tobytes(), ends.tobytes(), names]
+    crc = zlib.crc32(HEADER.pack(MAGIC, SNAPSHOT_VERSION, BYTE_ORDERS[sys.byteorder], last_id, len(rows), 0))
+    for part in body:
+        crc = zlib.crc32(part, crc)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, SNAPSHOT_VERSION, BYTE_ORDERS[sys.byteorder], last_id, len(rows), crc))
+        for part in body:
+            f.write(part)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return last_id, len(rows)
+
+
+def read_snapshot(path):
+    """Memory-map a snapshot and return (last score id, [(user_id, username, best), ...] in rank order).
+
+    Returns None when the file is missing, from another version or byte order,
+    or fails its checksum; the caller then loads from the database instead.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                return _decode(view)
+            finally:
+                view.release()
+
+
+def _decode(view):
+    magic, version, byte_order, last_id, count, crc = HEADER.unpack_from(view)
+    if magic != MAGIC or version != SNAPSHOT_VERSION or byte_order != BYTE_ORDERS[sys.byteorder]:
+        return None
+    body = view[HEADER.size:]
+    header_crc = zlib.crc32(HEADER.pack(magic, version, byte_order, last_id, count, 0))
+    if len(body) < count * 20 or zlib.crc32(body, header_crc) != crc:
+        return None
+
+    user_ids = body[:count * 8].cast("q").tolist()
+    bests = body[count * 8:count * 16].cast("q").tolist()
+    ends = body[count * 16:count * 20].cast("I").tolist()
+    names = str(body[count * 20:], "utf-8")
+    starts = [0] + ends[:-1]
+    usernames = [names[start:end] for start, end in zip(starts, ends)]
+    return last_id, list(zip(user_ids, usernames, bests))
+
+
+class SnapshotWriter:
+    """Writes the snapshot every interval seconds from its own read-only connection.
+
+    Reading runs inside SQLite (which releases the GIL), and only one thread
+    writes the file, so request handling barely notices it. close() writes a
+    final snapshot, which makes the next start warm.
+    """
+
+    def __init__(self, db_name, path, interval=SNAPSHOT_INTERVAL):
+        self.uri = pathlib.Path(db_name).absolute().as_uri() + "?mode=ro"
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="snapshot-writer", daemon=True)
+        if interval > 0:
+            self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        """Write a snapshot now; errors are reported and the previous snapshot is kept."""
+        try:
+            conn = configure_connection(sqlite3.connect(self.uri, uri=True, timeout=10))
+            try:
+                last_id, players = write_snapshot(self.path, conn)
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Snapshot not written: {e}")
+            return
+        print(f"Snapshot written: {players} players up to score {last_id}")
+
+    def close(self):
+        """Stop the periodic writes and write one last snapshot."""
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.write()
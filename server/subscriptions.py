@@ -0,0 +1,145 @@
+import select
+import threading
+import time
+
+from protocol import CODECS, encode_frame
+
+PUSH_REQUEST_ID = 0  # Request id carried by server-initiated frames; clients number from 1
+PUSH_INTERVAL = 0.25  # Minimum seconds between two pushes
+SUBSCRIPTION_TOP_N = 10
+MAX_PUSH_BUFFER = 256 * 1024  # Unsent bytes after which a slow asyncio subscriber is dropped
+
+
+class SocketPusher:
+    """Pushes frames to a thread-mode client, sharing its handler's send lock.
+
+    encoding is the connection's negotiated encoding; the handler only changes
+    it while holding send_lock, so a push is never sent in the wrong one.
+    """
+
+    def __init__(self, sock, send_lock):
+        self.sock = sock
+        self.send_lock = send_lock
+        self.encoding = "text"
+
+    def push(self, payloads):
+        """Send a push frame from {encoding: payload}; returns False if the client should be unsubscribed."""
+        try:
+            # A client that stopped reading must not stall the broadcaster thread
+            _, writable, _ = select.select([], [self.sock], [], 0)
+            if not writable:
+                return False
+            with self.send_lock:
+                self.sock.sendall(encode_frame(PUSH_REQUEST_ID, payloads[self.encoding]))
+            return True
+        except (OSError, ValueError):
+            return False
+
+
+class StreamPusher:
+    """Pushes frames to an asyncio client from the broadcaster thread.
+
+    encoding is only changed on the event loop, where write() picks the payload.
+    """
+
+    def __init__(self, loop, writer):
+        self.loop = loop
+        self.writer = writer
+        self.encoding = "text"
+
+    def push(self, payloads):
+        """Queue a push frame on the event loop; returns False if the client should be unsubscribed."""
+        if self.writer.is_closing() or self.writer.transport.get_write_buffer_size() > MAX_PUSH_BUFFER:
+            return False
+        try:
+            self.loop.call_soon_threadsafe(self.write, payloads)
+        except RuntimeError:  # Event loop already closed
+            return False
+        return True
+
+    def write(self, payloads):
+        self.writer.write(encode_frame(PUSH_REQUEST_ID, payloads[self.encoding]))
+
+
+class LeaderboardBroadcaster:
+    """Pushes coalesced top-N changes to every subscribed connection.
+
+    notify() only sets a flag. A background thread wakes on it, computes the top N
+    once, and sends every subscriber the ranks that changed since the previous push
+    as `LEADERBOARD_DIFF|rank:username:score|...`. Changes arriving within
+    PUSH_INTERVAL of a push are folded into the next one, so the cost per change is
+    one top-N read no matter how many spectators are connected.
+    """
+
+    def __init__(self, leaderboard, top_n=SUBSCRIPTION_TOP_N, interval=PUSH_INTERVAL):
+        self.leaderboard = leaderboard
+        self.top_n = top_n
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.last_top = leaderboard.top(top_n)  # State every subscriber has been sent
+        self.changed = threading.Event()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, name="leaderboard-push", daemon=True)
+        self.thread.start()
+
+    def subscribe(self, pusher):
+        """Register a connection and return its initial snapshot as (username, score) entries."""
+        with self.lock:
+            self.subscribers.add(pusher)
+            # Snapshot the last pushed state so the next diff applies cleanly on top of it
+            return self.last_top
+
+    def unsubscribe(self, pusher):
+        with self.lock:
+            self.subscribers.discard(pusher)
+
+    def is_subscribed(self, pusher):
+        return pusher in self.subscribers
+
+    def subscriber_count(self):
+        return len(self.subscribers)
+
+    def notify(self):
+        """Signal that the leaderboard may have changed."""
+        self.changed.set()
+
+    def close(self):
+        self.stopped = True
+        self.changed.set()
+        self.thread.join()
+
+    def run(self):
+        while True:
+            self.changed.wait()
+            if self.stopped:
+                return
+            self.changed.clear()
+            try:
+                self.publish()
+            except Exception as e:  # Keep pushing later changes
+                print(f"Leaderboard push failed: {e}")
+            time.sleep(self.interval)
+
+    def publish(self):
+        """Diff the current top N against the last push and send the changed ranks."""
+        top = self.leaderboard.top(self.top_n)
+        with self.lock:
+            changes = [
+                (rank, entry[0], entry[1])
+                for rank, entry in enumerate(top, start=1)
+                if rank > len(self.last_top) or self.last_top[rank - 1] != entry
+            ]
+            if not changes:
+                return
+            self.last_top = top
+            subscribers = list(self.subscribers)
+
+        # Encode once per encoding rather than once per subscriber
+        message = ("LEADERBOARD_DIFF", *changes)
+        payloads = {name: encode(message) for name, (encode, _) in CODECS.items()}
+        dropped = [pusher for pusher in subscribers if not pusher.push(payloads)]
+        if dropped:
+            with self.lock:
+                self.subscribers.difference_update(dropped)
+            print(f"Dropped {len(dropped)} leaderboard subscribers that stopped reading")
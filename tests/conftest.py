@@ -0,0 +1,45 @@
+import pathlib
+import sys
+
+import pytest
+
+# The server and the client are run as scripts from their own directories, so their modules import flat
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT / "server"), str(ROOT / "cleint")]
+
+from database import init_db  # noqa: E402
+from engine import DIRECTIONS, OPPOSITE  # noqa: E402
+
+
+def steer(engine, rng, noise):
+    """Direction toward the food that avoids walls and the body, with noise so games differ.
+
+    Returns None when every move is fatal. Steering like this makes games long
+    enough for the snake to grow and eventually run into itself.
+    """
+    head_x, head_y = engine.body[0]
+    options = []
+    for name, (dx, dy) in DIRECTIONS.items():
+        if name == OPPOSITE[engine.direction]:
+            continue
+        cell = (head_x + dx, head_y + dy)
+        if not (0 <= cell[0] < engine.width and 0 <= cell[1] < engine.height):
+            continue
+        if engine.is_occupied(cell) and cell != engine.body[-1]:
+            continue
+        distance = abs(cell[0] - engine.food[0]) + abs(cell[1] - engine.food[1]) if engine.food else 0
+        options.append((distance + rng.random() * noise, name))
+    return min(options)[1] if options else None
+
+
+@pytest.fixture(name="steer")
+def steer_fixture():
+    return steer
+
+
+@pytest.fixture
+def db_name(tmp_path):
+    """A migrated database in a temporary directory."""
+    path = str(tmp_path / "snake_game.db")
+    init_db(path)
+    return path
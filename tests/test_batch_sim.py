@@ -0,0 +1,46 @@
+"""BatchSimulator must stay in lockstep with SnakeEngine for the same seeds and turns."""
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from batch_sim import DIRECTION_CODES, DIRECTION_NAMES, NO_TURN, BatchSimulator  # noqa: E402
+from engine import SnakeEngine  # noqa: E402
+
+
+@pytest.mark.parametrize("count, width, height, max_ticks", [
+    (500, 6, 3, 2000),  # The smallest board the start fits: some games fill it
+    (60, 40, 30, 3000),  # The game's board
+])
+def test_batch_matches_engine(count, width, height, max_ticks, steer):
+    rng = random.Random(count)
+    sim = BatchSimulator(count, width, height, seeds=range(count))
+    engines = [SnakeEngine(width, height, seed=seed) for seed in range(count)]
+    full_board = 0
+
+    for tick in range(max_ticks):
+        if all(engine.game_over for engine in engines):
+            break
+        turns = np.full(count, NO_TURN, dtype=np.int8)
+        for game, engine in enumerate(engines):
+            if not engine.game_over and rng.random() < 0.9:
+                turns[game] = DIRECTION_CODES[steer(engine, rng, 2) or rng.choice(DIRECTION_NAMES)]
+        ate = sim.step(turns)
+
+        for game, engine in enumerate(engines):
+            if engine.game_over:
+                continue
+            if turns[game] != NO_TURN:
+                engine.turn(DIRECTION_NAMES[turns[game]])
+            assert engine.step() == ate[game], f"game {game} tick {tick}"
+            assert engine.game_over == sim.game_over[game], f"game {game} tick {tick}"
+            assert engine.score == sim.score[game], f"game {game} tick {tick}"
+            assert list(engine.body) == sim.snake(game), f"game {game} tick {tick}"
+            assert engine.food == sim.food_position(game), f"game {game} tick {tick}"
+            full_board += engine.food is None
+
+    self_collisions = sum(engine.game_over and list(engine.body).count(engine.body[0]) > 1 for engine in engines)
+    assert self_collisions > 0  # The games got long enough to exercise the body checks
+    if width * height < 20:
+        assert full_board > 0  # ...and the small board's free list ran dry
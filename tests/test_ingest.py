@@ -0,0 +1,24 @@
+"""ScoreWriter must write each client id once and report exactly the rows it inserted."""
+import sqlite3
+
+from ingest import ScoreWriter
+
+
+def test_resent_client_ids_are_written_once(db_name):
+    reported = []
+    writer = ScoreWriter(db_name, on_written=reported.extend)
+    writer.submit(1, 10, 1000, "a")
+    writer.submit(1, 12, 1000, "a")  # Same batch
+    writer.submit(2, 10, 1000, "a")  # Another player's id
+    writer.submit(1, 7, 1000)  # No id: always written, never reported
+    writer.execute("SELECT 1")  # Wait for the batch to commit
+    writer.submit(1, 999, 2000, "a")  # A later batch
+    writer.submit(1, 20, 2000, "b")
+    assert writer.close() == 0
+
+    with sqlite3.connect(db_name) as conn:
+        scores = conn.execute("SELECT user_id, score, client_id FROM scores ORDER BY id").fetchall()
+        stats = conn.execute("SELECT user_id, best, games, last_played FROM user_stats ORDER BY user_id").fetchall()
+    assert scores == [(1, 10, "a"), (2, 10, "a"), (1, 7, None), (1, 20, "b")]
+    assert stats == [(1, 20, 3, 2000), (2, 10, 1, 1000)]
+    assert reported == [(1, 10, 1000, "a"), (2, 10, 1000, "a"), (1, 20, 2000, "b")]
@@ -0,0 +1,73 @@
+"""RankedList and LeaderboardIndex must order players exactly like the SQL they replaced."""
+import bisect
+import random
+import sqlite3
+
+import pytest
+
+import leaderboard
+from leaderboard import LeaderboardIndex, RankedList
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_ranked_list_matches_sorted(seed, monkeypatch):
+    monkeypatch.setattr(leaderboard, "BUCKET_SIZE", 4)  # Splits and emptied buckets every few operations
+    rng = random.Random(seed)
+    expected = sorted(rng.sample(range(1000), rng.choice([0, 3, 50])))
+    ranked = RankedList(expected)
+
+    for step in range(3000):
+        # Grow, then shrink back to empty so buckets both split and empty out
+        if expected and (rng.random() < 0.45 if step < 1500 else rng.random() < 0.8):
+            key = rng.choice(expected)
+            expected.remove(key)
+            ranked.remove(key)
+        else:
+            key = rng.randrange(1000)
+            if key in expected:
+                continue
+            bisect.insort(expected, key)
+            ranked.add(key)
+
+        assert len(ranked) == len(expected)
+        if rng.random() < 0.2:
+            assert [ranked.index(key) for key in expected] == list(range(len(expected)))
+        start = rng.randrange(-2, len(expected) + 3)
+        stop = start + rng.randrange(0, 12)
+        assert ranked.slice(start, stop) == expected[max(start, 0):max(stop, 0)]
+        for position in range(0, len(expected), 7):
+            bucket_index, offset = ranked.locate(position)
+            assert ranked.buckets[bucket_index][offset] == expected[position]
+    assert ranked.slice(0, len(expected) + 1) == expected
+
+
+def test_leaderboard_index_matches_sql(monkeypatch):
+    monkeypatch.setattr(leaderboard, "BUCKET_SIZE", 4)
+    rng = random.Random(7)
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT)")
+    conn.execute("CREATE TABLE scores (user_id INTEGER, score INTEGER)")
+    conn.executemany("INSERT INTO users VALUES (?, ?)", [(i, f"player{i}") for i in range(1, 201)])
+    index = LeaderboardIndex()
+    for _ in range(2000):
+        user_id, score = rng.randint(1, 200), rng.randint(0, 60)  # Plenty of ties
+        conn.execute("INSERT INTO scores VALUES (?, ?)", (user_id, score))
+        index.update(user_id, score, f"player{user_id}")
+
+    rows = conn.execute("""
+        SELECT users.id, users.username, MAX(scores.score)
+        FROM scores
+        JOIN users ON scores.user_id = users.id
+        GROUP BY scores.user_id
+        ORDER BY MAX(scores.score) DESC, scores.user_id
+    """).fetchall()
+    board = [(username, best) for _, username, best in rows]
+    assert len(index) == len(board)
+    for offset in (0, 3, 4, 5, 97, len(board) - 1, len(board)):
+        assert index.page(offset, 10) == board[offset:offset + 10]
+    for position, (user_id, *_) in enumerate(rows):
+        rank, first_rank, entries = index.rank(user_id, neighbours=2)
+        assert rank == position + 1
+        assert first_rank == max(position - 2, 0) + 1
+        assert entries == board[first_rank - 1:position + 3]
+    assert index.rank(201) is None
@@ -0,0 +1,51 @@
+"""server/replay.py mirrors the rules of cleint/engine.py; these tests fail as soon as the two drift apart."""
+import random
+
+import pytest
+
+from engine import DIRECTIONS, SnakeEngine
+from replay import MAX_REPLAY_TICKS, parse_moves, simulate
+
+
+def play(seed, rng, steer):
+    """Play one seeded game to the end, mixing steering, random turns and key mashing."""
+    engine = SnakeEngine(seed=seed)
+    noise = rng.choice([0.5, 2, 5])
+    steer_chance = rng.choice([0.3, 0.9])
+    while not engine.game_over:
+        if rng.random() < steer_chance:
+            engine.turn(steer(engine, rng, noise) or rng.choice(list(DIRECTIONS)))
+        if rng.random() < 0.02:
+            engine.turn(rng.choice(list(DIRECTIONS)))  # Two keys in one tick
+        engine.step()
+    return engine
+
+
+def test_replay_reproduces_engine_score(steer):
+    rng = random.Random(1)
+    for seed in range(300):
+        engine = play(seed, rng, steer)
+        runs = parse_moves(engine.replay())
+        assert simulate(engine.seed, runs) == engine.score, f"seed {seed}"
+
+
+def test_replay_must_end_on_the_crash(steer):
+    rng = random.Random(2)
+    for seed in range(50):
+        engine = play(seed, rng, steer)
+        runs = parse_moves(engine.replay())
+        letter, count = runs[-1]
+        shortened = runs[:-1] + [(letter, count - 1)] if count > 1 else runs[:-1]
+        assert simulate(engine.seed, shortened) is None
+        assert simulate(engine.seed, runs + [("U", 1)]) is None
+
+
+@pytest.mark.parametrize("moves", ["", "R", "R0", "X3", "R1234567", "r3", "R3 U2"])
+def test_malformed_moves_are_refused(moves):
+    with pytest.raises(ValueError):
+        parse_moves(moves)
+
+
+def test_overlong_replay_is_refused():
+    with pytest.raises(ValueError, match="too long"):
+        parse_moves("R99999" * (MAX_REPLAY_TICKS // 99999 + 1))
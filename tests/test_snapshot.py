@@ -0,0 +1,145 @@
+"""The leaderboard snapshot must round-trip through its file format and never be trusted when damaged or stale."""
+import random
+import shutil
+import sqlite3
+import struct
+import sys
+from array import array
+
+import pytest
+
+from app import GameServer
+from ingest import ScoreWriter
+from leaderboard import LeaderboardIndex
+from snapshot import BYTE_ORDERS, HEADER, SNAPSHOT_QUERY, read_snapshot, snapshot_path, write_snapshot
+
+USERNAMES = ["alice", "Zoë", "名前", "bob", "ßtraße", "x" * 40]
+
+
+def add_players(db_name, usernames):
+    with sqlite3.connect(db_name) as conn:
+        conn.executemany("INSERT INTO users (username, password, email) VALUES (?, '', ?)",
+                         [(name, f"{name}@example.com") for name in usernames])
+
+
+def add_scores(db_name, scores):
+    writer = ScoreWriter(db_name)
+    for user_id, score in scores:
+        writer.submit(user_id, score, 1700000000)
+    assert writer.close() == 0
+
+
+def random_scores(rng, count):
+    return [(rng.randint(1, len(USERNAMES)), rng.randint(0, 50)) for _ in range(count)]
+
+
+def snapshot_of(db_name):
+    with sqlite3.connect(db_name, isolation_level=None) as conn:
+        return write_snapshot(snapshot_path(db_name), conn)
+
+
+def board_from_database(db_name):
+    index = LeaderboardIndex()
+    with sqlite3.connect(db_name) as conn:
+        index.load(conn.cursor())
+    return index.page(0, len(index))
+
+
+def board_from_server(db_name):
+    server = GameServer(db_name=db_name, snapshot_interval=0, write_snapshots=False)
+    try:
+        return server.leaderboard.page(0, len(server.leaderboard))
+    finally:
+        server.close()
+
+
+@pytest.fixture
+def players(db_name):
+    add_players(db_name, USERNAMES)
+    add_scores(db_name, random_scores(random.Random(1), 200))
+    return db_name
+
+
+def test_snapshot_round_trip(players):
+    last_id, count = snapshot_of(players)
+    with sqlite3.connect(players) as conn:
+        rows = conn.execute(SNAPSHOT_QUERY).fetchall()
+    assert (last_id, count) == (200, len(USERNAMES))
+    assert read_snapshot(snapshot_path(players)) == (last_id, rows)
+
+    # Columnar body: user ids, bests, username ends counted in characters, then the UTF-8 names
+    data = open(snapshot_path(players), "rb").read()
+    body = data[HEADER.size:]
+    ends = array("I", body[count * 16:count * 20]).tolist()
+    assert array("q", body[:count * 8]).tolist() == [user_id for user_id, _, _ in rows]
+    assert array("q", body[count * 8:count * 16]).tolist() == [best for _, _, best in rows]
+    assert ends[-1] == len("".join(name for _, name, _ in rows)) < len(body) - count * 20
+    assert body[count * 20:].decode() == "".join(name for _, name, _ in rows)
+
+
+def test_empty_snapshot(db_name):
+    assert snapshot_of(db_name) == (0, 0)
+    assert read_snapshot(snapshot_path(db_name)) == (0, [])
+
+
+def corrupt(data, how):
+    if how == "flipped byte":
+        return data[:-3] + bytes((data[-3] ^ 0x01,)) + data[-2:]
+    if how == "truncated body":
+        return data[:-5]
+    if how == "truncated header":
+        return data[:HEADER.size - 1]
+    if how == "empty":
+        return b""
+    magic, version, byte_order, last_id, count, crc = HEADER.unpack_from(data)
+    if how == "other byte order":
+        byte_order = BYTE_ORDERS["big" if sys.byteorder == "little" else "little"]
+    elif how == "other version":
+        version += 1
+    elif how == "bad magic":
+        magic = b"JUNK"
+    elif how == "inflated count":
+        count += 1
+    elif how == "older last id":
+        last_id -= 1
+    return HEADER.pack(magic, version, byte_order, last_id, count, crc) + data[HEADER.size:]
+
+
+@pytest.mark.parametrize("how", ["flipped byte", "truncated body", "truncated header", "empty",
+                                 "other byte order", "other version", "bad magic", "inflated count",
+                                 "older last id"])
+def test_damaged_snapshot_is_ignored(players, how):
+    snapshot_of(players)
+    path = snapshot_path(players)
+    data = open(path, "rb").read()
+    with open(path, "wb") as f:
+        f.write(corrupt(data, how))
+    assert read_snapshot(path) is None
+    assert board_from_server(players) == board_from_database(players)
+
+
+def test_missing_snapshot_is_ignored(players):
+    assert read_snapshot(snapshot_path(players)) is None
+    assert board_from_server(players) == board_from_database(players)
+
+
+def test_server_applies_scores_newer_than_the_snapshot(players):
+    snapshot_of(players)
+    add_players(players, ["late"])
+    add_scores(players, random_scores(random.Random(2), 50) + [(len(USERNAMES) + 1, 99)])
+    assert board_from_server(players) == board_from_database(players)
+    assert board_from_server(players)[0] == ("late", 99)
+
+
+def test_snapshot_newer_than_the_database_is_ignored(players, tmp_path):
+    # A snapshot left over from another database that has seen more scores than this one
+    other = str(tmp_path / "other.db")
+    with sqlite3.connect(players) as source, sqlite3.connect(other) as copy:
+        source.backup(copy)
+    add_scores(other, [(1, 1000)] * 10)
+    snapshot_of(other)
+    shutil.copy(snapshot_path(other), snapshot_path(players))
+
+    assert read_snapshot(snapshot_path(players))[0] > 200
+    assert board_from_server(players) == board_from_database(players)
+    assert ("alice", 1000) not in board_from_server(players)